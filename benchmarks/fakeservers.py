@@ -0,0 +1,385 @@
+import BaseHTTPServer
+import json
+import os.path
+import posixpath
+import random
+import re
+import socket
+import SocketServer
+import sys
+import threading
+import time
+import urllib
+import urlparse
+
+import lxml.etree
+
+
+
+# In-process stand-ins for the Oozie web service and WebHDFS.  They implement
+# just enough of each REST API for the client to run end to end, keep all
+# state in memory, and can add latency or fail a fraction of requests so the
+# client's behavior under a slow or flaky cluster can be measured.
+
+
+
+class _threadedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, clientAddress):
+        # Clients routinely drop idle keep-alive connections; only report
+        # errors which are not socket errors.
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request, clientAddress)
+
+class _handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Subclasses implement route(method, path, query) and are bound to their
+    # fake service as the "service" class attribute.
+    protocol_version = 'HTTP/1.1'
+    service = None
+
+    def log_message(self, *args):
+        pass
+
+    def _dispatch(self, method):
+        parsed = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(parsed.query))
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        with self.service._lock:
+            self.service.requests += 1
+            fail = self.service._random.random() < self.service.failureRate
+        if fail:
+            self._readBody()
+            return self.respond(self.service.failureStatus, {'error': 'injected failure'})
+        return self.route(method, urllib.unquote(parsed.path), query)
+
+    def do_GET(self):
+        self._dispatch('GET')
+    def do_PUT(self):
+        self._dispatch('PUT')
+    def do_POST(self):
+        self._dispatch('POST')
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _readBody(self):
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip().split(';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return ''.join(chunks)
+        return self.rfile.read(int(self.headers.get('content-length') or 0))
+
+    def respond(self, code, body=None, headers=None, contentType='application/json'):
+        if body is None:
+            data = ''
+        elif isinstance(body, basestring):
+            data = body
+        else:
+            data = json.dumps(body)
+        self.send_response(code)
+        for (k, v) in (headers or {}).iteritems():
+            self.send_header(k, v)
+        if data:
+            self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class _fakeService(object):
+    handlerClass = _handler
+
+    def __init__(self, latency=0.0, failureRate=0.0, seed=None):
+        # latency is added to every request, in seconds.  failureRate is the
+        # fraction of requests answered with failureStatus (500 unless
+        # changed) instead of being served.
+        self.latency = latency
+        self.failureRate = failureRate
+        self.failureStatus = 500
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        service = self
+        class handler(self.handlerClass):
+            pass
+        handler.service = service
+        self._server = _threadedServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+        return False
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+
+
+class _webHdfsHandler(_handler):
+    def route(self, method, path, query):
+        root = '/webhdfs/v1'
+        if not path.startswith(root):
+            return self.respond(404, {'RemoteException': {'message': 'Not a WebHDFS path: ' + path}})
+        path = posixpath.normpath('/' + path[len(root):].lstrip('/'))
+        op = query.get('op', '').upper()
+        fs = self.service
+        if op == 'MKDIRS' and method == 'PUT':
+            fs.mkdirs(path)
+            return self.respond(200, {'boolean': True})
+        elif op == 'DELETE' and method == 'DELETE':
+            return self.respond(200, {'boolean': fs.delete(path)})
+        elif op == 'LISTSTATUS' and method == 'GET':
+            with fs._lock:
+                if path in fs.files:
+                    statuses = [fs._status('', path)]
+                elif path in fs.directories:
+                    statuses = [fs._status(name, posixpath.join(path, name)) for name in sorted(fs.children.get(path, ()))]
+                else:
+                    return self.respond(404, {'RemoteException': {'exception': 'FileNotFoundException', 'message': 'File ' + path + ' does not exist.'}})
+            return self.respond(200, {'FileStatuses': {'FileStatus': statuses}})
+        elif op in ['CREATE', 'OPEN'] and 'datanode' not in query:
+            # The name node redirects data transfers to a data node; here the
+            # data node is simply this same server.
+            location = 'http://' + fs.host + ':' + str(fs.port) + self.path + '&datanode=true'
+            if method == 'PUT':
+                self._readBody()
+            return self.respond(307, headers={'Location': location})
+        elif op == 'CREATE' and method == 'PUT':
+            data = self._readBody()
+            fs.mkdirs(posixpath.dirname(path))
+            with fs._lock:
+                fs.files[path] = data
+                fs.children.setdefault(posixpath.dirname(path), set()).add(posixpath.basename(path))
+            return self.respond(201, headers={'Location': 'webhdfs://' + path})
+        elif op == 'OPEN' and method == 'GET':
+            with fs._lock:
+                data = fs.files.get(path)
+            if data is None:
+                return self.respond(404, {'RemoteException': {'exception': 'FileNotFoundException', 'message': 'File ' + path + ' does not exist.'}})
+            return self.respond(200, data, contentType='application/octet-stream')
+        return self.respond(400, {'RemoteException': {'message': 'Unsupported operation ' + method + ' ' + op}})
+
+class webHdfsServer(_fakeService):
+    # An in-memory HDFS behind the WebHDFS REST API; the same server plays
+    # both name node and data node.
+    handlerClass = _webHdfsHandler
+
+    def __init__(self, *args, **kwargs):
+        super(webHdfsServer, self).__init__(*args, **kwargs)
+        self.files = {}
+        self.directories = set(['/'])
+        self.children = {}
+
+    @property
+    def url(self):
+        return 'http://' + self.host + ':' + str(self.port) + '/webhdfs/v1/'
+
+    def mkdirs(self, path):
+        with self._lock:
+            path = posixpath.normpath(path)
+            while path not in self.directories:
+                self.directories.add(path)
+                parent = posixpath.dirname(path)
+                self.children.setdefault(parent, set()).add(posixpath.basename(path))
+                path = parent
+
+    def delete(self, path):
+        with self._lock:
+            existed = path in self.files or path in self.directories
+            for p in [f for f in self.files if f == path or f.startswith(path.rstrip('/') + '/')]:
+                del self.files[p]
+            for p in [d for d in self.directories if d != '/' and (d == path or d.startswith(path.rstrip('/') + '/'))]:
+                self.directories.discard(p)
+                self.children.pop(p, None)
+            self.children.get(posixpath.dirname(path), set()).discard(posixpath.basename(path))
+            return existed
+
+    def populate(self, root, width, depth=1, data='line\n'):
+        # Build a tree below root where every directory holds width entries,
+        # directories down to the given depth and files at the bottom, as a
+        # MapReduce job with many reducers leaves behind.  A _SUCCESS marker
+        # sits at the top.  Returns the number of files created.
+        def build(path, level):
+            if level == depth:
+                for i in xrange(width):
+                    self.files[posixpath.join(path, 'part-%05d' % i)] = data
+                self.children.setdefault(path, set()).update(['part-%05d' % i for i in xrange(width)])
+                return width
+            count = 0
+            for i in xrange(width):
+                subdirectory = posixpath.join(path, 'dir-%05d' % i)
+                self.mkdirs(subdirectory)
+                count += build(subdirectory, level + 1)
+            return count
+        with self._lock:
+            self.mkdirs(root)
+            self.files[posixpath.join(root, '_SUCCESS')] = ''
+            self.children.setdefault(root, set()).add('_SUCCESS')
+            return build(root, 1)
+
+    def _status(self, name, path):
+        if path in self.files:
+            return {'pathSuffix': name, 'type': 'FILE', 'length': len(self.files[path])}
+        return {'pathSuffix': name, 'type': 'DIRECTORY', 'length': 0}
+
+
+
+class _oozieHandler(_handler):
+    def route(self, method, path, query):
+        prefix = '/oozie/v1/'
+        if not path.startswith(prefix):
+            return self.respond(404, {'error': 'Not an Oozie path: ' + path})
+        resource = path[len(prefix):].strip('/')
+        server = self.service
+        if resource == 'admin/status' and method == 'GET':
+            return self.respond(200, {'systemMode': server.systemMode})
+        elif resource == 'admin/configuration' and method == 'GET':
+            return self.respond(200, server.configuration)
+        elif resource == 'jobs' and method == 'GET':
+            return self.respond(200, server.listJobs(query))
+        elif resource == 'jobs' and method == 'POST':
+            return self.respond(201, {'id': server.submitJob(self._readBody())})
+        elif resource.startswith('job/'):
+            jobId = resource[len('job/'):]
+            with server._lock:
+                job = server.jobs.get(jobId)
+            if job is None:
+                # Oozie identifies its errors by code in a response header.
+                return self.respond(400, {'error': 'Job does not exist: ' + jobId}, headers={'oozie-error-code': 'E0604', 'oozie-error-message': 'E0604: Job does not exist [' + jobId + ']'})
+            if method == 'GET':
+                if query.get('show') == 'log':
+                    return self._respondLog(server.logs.get(jobId, ''), query)
+                if query.get('show') == 'definition':
+                    if 'definition' not in job:
+                        return self.respond(400, {'error': 'No definition for job ' + jobId})
+                    return self.respond(200, job['definition'], contentType='text/xml')
+                return self.respond(200, job)
+            elif method == 'PUT':
+                action = query.get('action')
+                if action not in server.transitions:
+                    return self.respond(400, {'error': 'Unsupported action ' + str(action)})
+                with server._lock:
+                    job['status'] = server.transitions[action]
+                return self.respond(200)
+        return self.respond(400, {'error': 'Unsupported request ' + method + ' ' + resource})
+
+    def _respondLog(self, log, query):
+        # Like Oozie 4.2, send only lines logged at or after the logfilter
+        # start= time (with the untimestamped lines following them) when
+        # the server is configured to.
+        filters = dict([f.split('=', 1) for f in query.get('logfilter', '').split(';') if '=' in f])
+        if self.service.logFilters and 'start' in filters:
+            kept = []
+            keep = False
+            for line in log.splitlines(True):
+                match = re.match(r'\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}', line)
+                if match is not None:
+                    keep = match.group(0) >= filters['start']
+                if keep:
+                    kept.append(line)
+            log = ''.join(kept)
+        # Honor "Range: bytes=N-" when the server is configured to, as a
+        # server fronted by a range-capable proxy would.
+        requested = self.headers.get('range', '')
+        if self.service.rangeRequests and requested.startswith('bytes=') and requested.endswith('-'):
+            start = int(requested[len('bytes='):-1])
+            if start >= len(log):
+                return self.respond(416, headers={'Content-Range': 'bytes */' + str(len(log))})
+            return self.respond(206, log[start:], headers={'Content-Range': 'bytes ' + str(start) + '-' + str(len(log) - 1) + '/' + str(len(log))}, contentType='text/plain')
+        return self.respond(200, log, contentType='text/plain')
+
+class oozieServer(_fakeService):
+    # Accepts submissions, remembers jobs in memory and moves them straight
+    # to a final status on "start", so polling loops terminate immediately.
+    handlerClass = _oozieHandler
+
+    def __init__(self, nameNode='hdfs://localhost:8020', jobTracker='localhost:8021', finalStatus='SUCCEEDED', *args, **kwargs):
+        super(oozieServer, self).__init__(*args, **kwargs)
+        self.systemMode = 'NORMAL'
+        self.configuration = {
+            'oozie.service.HadoopAccessorService.nameNode.whitelist': nameNode,
+            'oozie.service.HadoopAccessorService.jobTracker.whitelist': jobTracker,
+        }
+        self.transitions = {
+            'start': finalStatus,
+            'suspend': 'SUSPENDED',
+            'resume': 'RUNNING',
+            'kill': 'KILLED',
+        }
+        self.jobs = {}
+        # Job id to log text; append to a job's log to simulate progress.
+        self.logs = {}
+        # Whether job log requests honor the Range header, and the logfilter
+        # start= time Oozie 4.2 and later take.
+        self.rangeRequests = False
+        self.logFilters = False
+        self._sequence = 0
+
+    @property
+    def url(self):
+        return 'http://' + self.host + ':' + str(self.port) + '/oozie/'
+
+    def addJob(self, appName='job', status='PREP', actions=None, **fields):
+        # Register a job directly, bypassing submission; returns its id.
+        # Pass definition= to have show=definition return that XML.
+        with self._lock:
+            self._sequence += 1
+            jobId = '%07d-%s-oozie-oozi-W' % (self._sequence, '000000000000000')
+            job = {
+                'id': jobId,
+                'appName': appName,
+                'status': status,
+                'actions': actions or [],
+            }
+            job.update(fields)
+            self.jobs[jobId] = job
+        return jobId
+
+    def submitJob(self, body):
+        properties = {}
+        for prop in lxml.etree.fromstring(body).iterchildren(tag='property'):
+            properties[prop.findtext('name')] = prop.findtext('value')
+        appPath = properties.get('oozie.wf.application.path', '')
+        return self.addJob(appName=os.path.basename(appPath.rstrip('/')) or 'job', appPath=appPath, conf=body)
+
+    def listJobs(self, query):
+        filters = dict([f.split('=', 1) for f in query.get('filter', '').split(';') if '=' in f])
+        with self._lock:
+            workflows = [job for job in self.jobs.itervalues() if all([job.get({'name': 'appName'}.get(k, k)) == v for (k, v) in filters.iteritems()])]
+        workflows.sort(key=lambda job: job['id'], reverse=True)
+        offset = int(query.get('offset', 1)) - 1
+        length = int(query.get('len', 50))
+        return {
+            'total': len(workflows),
+            'offset': offset + 1,
+            'len': length,
+            'workflows': workflows[offset:offset + length],
+        }
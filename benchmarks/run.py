@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+import oozie
+import oozie.errors
+import oozie.hdfs
+import oozie.instrumentation
+import oozie.oozie
+
+from . import fakeservers
+
+
+
+# Benchmarks of the client's hot paths against the in-process fake servers.
+# Run with
+#   python -m benchmarks.run --output results.json
+# Every benchmark returns a dict of measurements; the whole run is written as
+# a single JSON document so results can be compared between revisions.
+
+
+
+def _timed(function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    return (time.time() - start, result)
+
+def _rate(count, elapsed):
+    if elapsed <= 0:
+        return None
+    return count / elapsed
+
+def _workflowDefinition(actions):
+    return {
+        'name': 'benchmarkWorkflow',
+        'actions': [{
+            'template': 'map-reduce',
+            'mapper': '/bin/cat',
+            'reducer': '/bin/cat',
+            'input': '${input}',
+        } for i in xrange(actions)],
+    }
+
+def _chainedWorkflow(actions):
+    # A workflow whose actions already transition one to the next, so that
+    # fix() only has to add the start, end and kill nodes.
+    wf = oozie.workflowJob(_workflowDefinition(actions))
+    names = [a.get('name') for a in wf.iterchildren(tag='action')]
+    for (action, nextName) in zip(wf.iterchildren(tag='action'), names[1:] + ['end']):
+        ok = action.makeelement('ok')
+        ok.set('to', nextName)
+        action.append(ok)
+    return wf
+
+
+
+def benchmarkSubmit(servers, count):
+    # Full submission of a one-action workflow: workflow upload, cluster
+    # discovery and the Oozie submit request.  "failures" counts only
+    # submissions which raised; submit() does not check the status of the
+    # workflow upload, so a failed upload still counts as a submission here.
+    # The "failedCalls" total recorded for every benchmark shows those.
+    failures = 0
+    start = time.time()
+    for i in xrange(count):
+        wf = oozie.workflowJob(_workflowDefinition(1))
+        wf.fix()
+        try:
+            wf.submit({'input': 'hdfs:///tmp/benchmark/input'})
+        except (oozie.errors.ClientError, oozie.errors.ServerError):
+            failures += 1
+    elapsed = time.time() - start
+    return {
+        'jobs': count,
+        'failures': failures,
+        'seconds': elapsed,
+        'jobsPerSecond': _rate(count, elapsed),
+    }
+
+def benchmarkStatusPoll(servers, count):
+    client = oozie.oozie.client(servers['oozie'].url)
+    jobId = servers['oozie'].addJob(status='RUNNING')
+    failures = 0
+    start = time.time()
+    for i in xrange(count):
+        try:
+            client.status(jobId)
+        except (oozie.errors.ClientError, oozie.errors.ServerError):
+            failures += 1
+    elapsed = time.time() - start
+    return {
+        'polls': count,
+        'failures': failures,
+        'seconds': elapsed,
+        'pollsPerSecond': _rate(count, elapsed),
+    }
+
+def benchmarkTransfer(servers, megabytes):
+    # Upload and download throughput, uncompressed and compressed on the fly.
+    client = oozie.hdfs.client(servers['webhdfs'].url)
+    line = 'INFO 2013-01-01 00:00:00 some.component: a typical log line with a request id 0123456789\n'
+    data = (line * (megabytes * 1024 * 1024 / len(line) + 1))[:megabytes * 1024 * 1024]
+    size = float(len(data)) / (1024 * 1024)
+    results = {'megabytes': size}
+    (elapsed, status) = _timed(client.write, '/tmp/benchmark/transfer/plain', data)
+    results['upload'] = {'seconds': elapsed, 'status': status, 'megabytesPerSecond': _rate(size, elapsed)}
+    for compression in sorted(oozie.hdfs.COMPRESSION_EXTENSIONS):
+        (elapsed, status) = _timed(client.write, '/tmp/benchmark/transfer/compressed', data, compression=compression)
+        stored = servers['webhdfs'].files.get(oozie.hdfs.compressedFilename('/tmp/benchmark/transfer/compressed', compression), '')
+        results['upload.' + compression] = {
+            'seconds': elapsed,
+            'status': status,
+            'megabytesPerSecond': _rate(size, elapsed),
+            'compressionRatio': _rate(len(data), len(stored)),
+        }
+    (elapsed, read) = _timed(client.read, '/tmp/benchmark/transfer/plain')
+    results['download'] = {'seconds': elapsed, 'complete': read == data, 'megabytesPerSecond': _rate(size, elapsed)}
+    return results
+
+def benchmarkOutputListing(servers, widths, depth, walks=3):
+    # Walk output trees of increasing width with iterOutputFilenames.  A walk
+    # which raises counts as a failure; rates cover successful walks only.
+    oozieServer = servers['oozie']
+    results = []
+    for width in widths:
+        outputPath = '/tmp/benchmark/output/width-' + str(width)
+        files = servers['webhdfs'].populate(outputPath, width, depth)
+        wf = oozie.workflowJob(_workflowDefinition(1))
+        wf._id = oozieServer.addJob(status='SUCCEEDED')
+        wf._outputPath = outputPath
+        failures = 0
+        listed = 0
+        seconds = 0.0
+        for i in xrange(walks):
+            start = time.time()
+            try:
+                listed += len(list(wf.iterOutputFilenames()))
+                seconds += time.time() - start
+            except (oozie.errors.ClientError, oozie.errors.ServerError):
+                failures += 1
+        results.append({
+            'width': width,
+            'depth': depth,
+            'files': files,
+            'walks': walks,
+            'failures': failures,
+            'listed': listed,
+            'seconds': seconds,
+            'filesPerSecond': _rate(listed, seconds),
+        })
+    return results
+
+def benchmarkWorkflowScaling(servers, actionCounts):
+    # fix() and validate() as the number of actions grows.
+    results = []
+    for count in actionCounts:
+        wf = _chainedWorkflow(count)
+        (fixSeconds, _) = _timed(wf.fix)
+        (validateSeconds, _) = _timed(wf.validate, fix=False)
+        results.append({
+            'actions': count,
+            'fixSeconds': fixSeconds,
+            'validateSeconds': validateSeconds,
+        })
+    return results
+
+
+
+def run(args):
+    webhdfsServer = fakeservers.webHdfsServer(latency=args.latency, failureRate=args.failure_rate, seed=args.seed)
+    oozieServer = fakeservers.oozieServer(latency=args.latency, failureRate=args.failure_rate, seed=args.seed)
+    with webhdfsServer, oozieServer:
+        oozieServer.configuration['oozie.service.HadoopAccessorService.nameNode.whitelist'] = 'hdfs://' + webhdfsServer.host + ':' + str(webhdfsServer.port)
+        # The client discovers both services through the environment.
+        os.environ['OOZIE_URL'] = oozieServer.url
+        os.environ['WEBHDFS_URL'] = webhdfsServer.url
+        servers = {'oozie': oozieServer, 'webhdfs': webhdfsServer}
+        scale = 1 if args.quick else 10
+        benchmarks = [
+            ('submit', lambda: benchmarkSubmit(servers, 10 * scale)),
+            ('statusPoll', lambda: benchmarkStatusPoll(servers, 100 * scale)),
+            ('transfer', lambda: benchmarkTransfer(servers, 1 * scale)),
+            ('outputListing', lambda: benchmarkOutputListing(servers, [10, 100, 1000] + ([] if args.quick else [5000]), 1)),
+            ('workflowScaling', lambda: benchmarkWorkflowScaling(servers, [10, 50, 100] + ([] if args.quick else [200, 500]))),
+        ]
+        results = {}
+        for (name, benchmark) in benchmarks:
+            if args.only and name not in args.only:
+                continue
+            logging.info('Running benchmark ' + name)
+            oozie.instrumentation.registry.reset()
+            # Count every call which failed, whether or not the client noticed.
+            failedCalls = []
+            def countFailure(event):
+                if event['status'] == 'error' or (isinstance(event['status'], int) and event['status'] >= 400):
+                    failedCalls.append(event)
+            oozie.instrumentation.addHook(countFailure)
+            try:
+                results[name] = benchmark()
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                logging.exception('Benchmark ' + name + ' failed')
+                results[name] = {'error': repr(e)}
+            finally:
+                oozie.instrumentation.removeHook(countFailure)
+            results[name] = {
+                'result': results[name],
+                'failedCalls': len(failedCalls),
+                'instrumentation': oozie.instrumentation.registry.snapshot(),
+            }
+    return {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'latency': args.latency,
+            'failureRate': args.failure_rate,
+            'seed': args.seed,
+            'quick': args.quick,
+        },
+        'benchmarks': results,
+    }
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    # The webhdfs module configures the root logger for debug output when it
+    # is imported; undo that so debug logging does not skew the timings.
+    logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger('requests.packages.urllib3.connectionpool').setLevel(logging.WARNING)
+    logging.getLogger('webhdfs').setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', type=str, default=None, help='file to write JSON results to (default stdout)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds of latency the fake servers add to every request')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests the fake servers fail with a 500')
+    parser.add_argument('--seed', type=int, default=0, help='seed for failure injection')
+    parser.add_argument('--quick', action='store_true', help='run fewer iterations')
+    parser.add_argument('--only', type=str, nargs='*', default=None, help='names of benchmarks to run')
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
@@ -16,6 +16,10 @@ from . import elements
 from . import oozie
 # We use the HDFS client to place workflows in the required location.
 from . import hdfs
+# Timings and counters for calls to the cluster.
+from . import instrumentation
+# The optional local record of submitted jobs.
+from . import registry
 
 
 
@@ -41,6 +45,73 @@ def _extractSingleNamenodeUri(namenodeConfiguration):
 
 
 
+# Once a job reaches one of these statuses it will not change again.
+TERMINAL_STATUSES = oozie.TERMINAL_STATUSES
+
+class jobHandle(object):
+    # A compact reference to a submitted job which is independent of the
+    # workflow XML it was submitted from.  Handles are cheap to keep around
+    # in large numbers, can be pickled, and can be passed to worker processes
+    # which monitor jobs on the caller's behalf.
+    __slots__ = ('id', 'appPath', 'outputPath', 'lastStatus', 'oozieUrl')
+    
+    def __init__(self, id, appPath=None, outputPath=None, lastStatus=None, oozieUrl=None):
+        self.id = id
+        self.appPath = appPath
+        self.outputPath = outputPath
+        self.lastStatus = lastStatus
+        # None means the OOZIE_URL environment variable of whichever process
+        # ends up using this handle.
+        self.oozieUrl = oozieUrl
+    
+    # Classes with __slots__ have no __dict__ for pickle to save, so spell
+    # out the state ourselves.
+    def __getstate__(self):
+        return tuple([getattr(self, name) for name in self.__slots__])
+    def __setstate__(self, state):
+        for (name, value) in zip(self.__slots__, state):
+            setattr(self, name, value)
+    
+    def __eq__(self, other):
+        return isinstance(other, jobHandle) and self.id == other.id
+    def __ne__(self, other):
+        return not self == other
+    def __hash__(self):
+        return hash(self.id)
+    def __repr__(self):
+        return 'jobHandle(' + repr(self.id) + ', lastStatus=' + repr(self.lastStatus) + ')'
+    
+    @property
+    def _oozieClient(self):
+        # Clients hold nothing but the URL, so build one per call rather than
+        # carrying it around.
+        return oozie.client(self.oozieUrl)
+    
+    @property
+    def finished(self):
+        # Whether the last known status is final.  Does not query Oozie.
+        return self.lastStatus in TERMINAL_STATUSES
+    
+    def refresh(self):
+        # Query Oozie for the current status and remember it.
+        self.lastStatus = self._oozieClient.status(self.id)
+        return self.lastStatus
+    
+    @property
+    def status(self):
+        return self.refresh()
+    
+    def error(self):
+        return self._oozieClient.error(self.id)
+
+# Module level so that it can be handed to multiprocessing.Pool.map, e.g.
+#   handles = pool.map(oozie.refreshJobHandle, handles)
+def refreshJobHandle(handle):
+    handle.refresh()
+    return handle
+
+
+
 class jobConfiguration(object):
     # A job is a particular configuration of work.
     # Jobs must be assigned to a cluster before they can be run.
@@ -87,6 +158,16 @@ class jobConfiguration(object):
             self.__oozieClient = oozie.client()
         return self.__oozieClient
     
+    # Submitted jobs are recorded in the registry named by OOZIE_JOB_REGISTRY,
+    # if there is one.  The registry is a convenience, so a registry we cannot
+    # open or write to is logged and otherwise ignored.
+    @property
+    def _jobRegistry(self):
+        path = os.environ.get('OOZIE_JOB_REGISTRY')
+        if path is None:
+            return None
+        return registry.optional(path)
+    
     
     # These properties generally need to be discovered or assigned once, at
     # which point they become static.
@@ -110,9 +191,34 @@ class jobConfiguration(object):
     @property
     def status(self):
         # Determine the status of this job, querying Oozie to find it.
-        return self._oozieClient.status(self.id)
+        status = self._oozieClient.status(self.id)
+        jobRegistry = self._jobRegistry
+        if jobRegistry is not None:
+            try:
+                jobRegistry.update(self.id, status)
+            except errors.ClientError as e:
+                logging.warning(str(e))
+        return status
+    
+    @property
+    def handle(self):
+        # A lightweight handle on this job, detached from the workflow XML,
+        # submitting the job first if necessary.  Paths we never assigned
+        # (e.g. for a job we only reconnected to by id) are left as None.
+        jobId = self.id
+        sourcePath = getattr(self, '_sourcePath', None)
+        outputPath = getattr(self, '_outputPath', None)
+        return jobHandle(
+            jobId,
+            appPath=(None if sourcePath is None else 'hdfs://' + ([''] + sourcePath.split('hdfs://', 1))[-1]),
+            outputPath=(None if outputPath is None else 'hdfs://' + ([''] + outputPath.split('hdfs://', 1))[-1]),
+            oozieUrl=self._oozieClient._url,
+        )
     
-    def upload(self, localPath, remotePath=None):
+    def upload(self, localPath, remotePath=None, compression=None):
+        # Passing compression='gzip' or compression='bzip2' compresses each
+        # file while it is sent and names it so Hadoop decompresses it on read.
+        # Files already named as compressed are uploaded unchanged.
         try:
             assert os.path.exists(localPath)
         except AssertionError:
@@ -132,18 +238,20 @@ class jobConfiguration(object):
             remotePath = os.path.join(self.sourcePath, remotePath)
         
         for localFilename in (walk(localPath) if os.path.isdir(localPath) else [localPath]):
-            print 'please upload '
-            print localFilename
             deltaPath = localPath.split(os.path.commonprefix([localFilename, localPath]), 1)[-1]
             if deltaPath == '':
                 remoteFilename = os.path.join(remotePath, os.path.basename(localFilename))
             else:
                 remoteFilename = os.path.join(remotePath, deltaPath)
-            print 'to'
-            print remoteFilename
+            logging.debug('Uploading "' + localFilename + '" to "' + remoteFilename + '"')
             self._hdfsClient.mkdir(os.path.dirname(remoteFilename))
             
-            status = self._hdfsClient.copyFromLocal(localFilename, remoteFilename)
+            if compression is None or hdfs.isCompressed(localFilename):
+                status = self._hdfsClient.copyFromLocal(localFilename, remoteFilename)
+            else:
+                with open(localFilename, 'rb') as f:
+                    status = self._hdfsClient.write(remoteFilename, f, compression=compression)
+                remoteFilename = hdfs.compressedFilename(remoteFilename, compression)
             try:
                 assert status == 201
             except AssertionError:
@@ -165,8 +273,10 @@ class jobConfiguration(object):
             workflowDirectory = os.path.join(WORKFLOW_SCRATCH_DIR, self.uniquifier)
             self._hdfsClient.mkdir(workflowDirectory)
             workflowPath = os.path.join(workflowDirectory, 'workflow.xml')
-            print lxml.etree.tostring(self, pretty_print=True)
-            self._hdfsClient.write(workflowPath, lxml.etree.tostring(self, pretty_print=True))
+            workflowXml = lxml.etree.tostring(self, pretty_print=True)
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug('Uploading workflow to "' + workflowPath + '":\n' + workflowXml)
+            self._hdfsClient.write(workflowPath, workflowXml)
             # Let's also upload an XML file which contains configuration defaults.
             #defaultConfigPath = os.path.join(workflowDirectory, 'config-default.xml')
             #defaultConfig = elements.configuration({
@@ -202,35 +312,55 @@ class jobConfiguration(object):
             raise errors.ClientError('Workflow job instance already submitted')
         except AttributeError:
             pass
-        # Compose the proper Oozie request which will submit the workflow to
-        # the cluster.
-        parameters = parameters or {}
-        if 'user.name' not in parameters:
-            parameters['user.name'] = 'hdfs'
-        if 'oozie.wf.application.path' not in parameters:
-            parameters['oozie.wf.application.path'] = 'hdfs://' + ([''] + self.sourcePath.split('hdfs://', 1))[-1]
-        # The Hadoop client jars must be uploaded to HDFS beforehand.
-        # TODO is this a sane default for most people?
-        if 'oozie.libpath' not in parameters:
-            parameters['oozie.libpath'] = 'hdfs:///user/' + parameters['user.name'] + '/lib'
-        # Ensure that the libpath exists and has some JARs.  If not, warn loudly.
-        # TODO
-        #if len(self._hdfsClient.listdir(parameters['oozie.libpath'])) == 0:
-        #    raise errors.ClientError('Libpath "' + parameters['oozie.libpath'] + '" does not exist or is empty.')
+        # Each phase of submission is timed separately and reported as a
+        # "job" operation named "submit.<phase>" so slow phases stand out.
+        with instrumentation.timer('job', 'submit'):
+            # Compose the proper Oozie request which will submit the workflow to
+            # the cluster.
+            parameters = parameters or {}
+            if 'user.name' not in parameters:
+                parameters['user.name'] = 'hdfs'
+            if 'oozie.wf.application.path' not in parameters:
+                with instrumentation.timer('job', 'submit.sourcePath'):
+                    parameters['oozie.wf.application.path'] = 'hdfs://' + ([''] + self.sourcePath.split('hdfs://', 1))[-1]
+            # The Hadoop client jars must be uploaded to HDFS beforehand.
+            # TODO is this a sane default for most people?
+            if 'oozie.libpath' not in parameters:
+                parameters['oozie.libpath'] = 'hdfs:///user/' + parameters['user.name'] + '/lib'
+            # Ensure that the libpath exists and has some JARs.  If not, warn loudly.
+            # TODO
+            #if len(self._hdfsClient.listdir(parameters['oozie.libpath'])) == 0:
+            #    raise errors.ClientError('Libpath "' + parameters['oozie.libpath'] + '" does not exist or is empty.')
+                
+            # Required parameters which you might not have set.
+            # We'll try to do it for you if we can.
+            with instrumentation.timer('job', 'submit.discoverCluster'):
+                if 'jobTracker' not in parameters:
+                    parameters['jobTracker'] = self._oozieClient.config().get('oozie.service.HadoopAccessorService.jobTracker.whitelist')
+                if 'nameNode' not in parameters:
+                    parameters['nameNode'] = _extractSingleNamenodeUri(self._oozieClient.config().get('oozie.service.HadoopAccessorService.nameNode.whitelist'))
             
-        # Required parameters which you might not have set.
-        # We'll try to do it for you if we can.
-        if 'jobTracker' not in parameters:
-            parameters['jobTracker'] = self._oozieClient.config().get('oozie.service.HadoopAccessorService.jobTracker.whitelist')
-        if 'nameNode' not in parameters:
-            parameters['nameNode'] = _extractSingleNamenodeUri(self._oozieClient.config().get('oozie.service.HadoopAccessorService.nameNode.whitelist'))
-        
-        # Default substitutions I think you might use and I am using to test this
-        if 'output' not in parameters:
-            parameters['output'] = 'hdfs://' + ([''] + self.outputPath.split('hdfs://', 1))[-1]
-        conf = elements.configuration(parameters)
-        print lxml.etree.tostring(conf, pretty_print=True)
-        self._id = self._oozieClient.submit(lxml.etree.tostring(conf))
+            # Default substitutions I think you might use and I am using to test this
+            if 'output' not in parameters:
+                parameters['output'] = 'hdfs://' + ([''] + self.outputPath.split('hdfs://', 1))[-1]
+            conf = elements.configuration(parameters)
+            confXml = lxml.etree.tostring(conf)
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug('Submitting job configuration:\n' + lxml.etree.tostring(conf, pretty_print=True))
+            # Open the registry before submitting, so a registry we cannot
+            # open is reported before the job exists rather than after.
+            jobRegistry = self._jobRegistry
+            with instrumentation.timer('job', 'submit.request'):
+                self._id = self._oozieClient.submit(confXml)
+            if jobRegistry is not None:
+                with instrumentation.timer('job', 'submit.register'):
+                    # Oozie holds newly submitted jobs in PREP until started.
+                    handle = self.handle
+                    handle.lastStatus = 'PREP'
+                    try:
+                        jobRegistry.record(handle, parameters)
+                    except errors.ClientError as e:
+                        logging.warning('Job ' + self._id + ' was submitted but not recorded: ' + str(e))
         return True
     def run(self):
         return self._oozieClient.run(self.id)
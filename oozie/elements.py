@@ -52,7 +52,8 @@ class workflow(_parameterizedElement):
         return actionElement
     
     def fix(self):
-        print lxml.etree.tostring(self, pretty_print=True)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug('Fixing workflow:\n' + lxml.etree.tostring(self, pretty_print=True))
         
         # Must have a start node
         if len(list(self.iterchildren(tag='start'))) < 1 and len(list(self.iterchildren(tag='action'))) > 0:
@@ -123,7 +124,8 @@ class workflow(_parameterizedElement):
         if fix:
             self.fix()
         
-        print lxml.etree.tostring(self, pretty_print=True)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug('Validating workflow:\n' + lxml.etree.tostring(self, pretty_print=True))
         
         try:
             assert len(list(self.iterchildren(tag='start'))) == 1, 'no start node'
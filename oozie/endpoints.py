@@ -0,0 +1,97 @@
+import threading
+import time
+
+
+
+# Health tracking for Oozie servers, shared by every client in the process so
+# that one caller discovering a dead or slow server spares all the others.
+
+# Seconds an endpoint sits out after failing, doubled for each consecutive
+# failure up to MAX_BACKOFF times this.
+RETRY_DELAY = 15.0
+MAX_BACKOFF = 8
+# Weight of the newest sample in each endpoint's moving average latency.
+LATENCY_WEIGHT = 0.3
+
+
+
+class endpointState(object):
+    def __init__(self, url):
+        self.url = url
+        # Moving average of successful request latency, None until measured.
+        self.latency = None
+        self.failures = 0
+        self.downUntil = 0.0
+
+    @property
+    def live(self):
+        return self.downUntil <= time.time()
+    
+    @property
+    def suspect(self):
+        # Back in rotation after failing, without having answered since.
+        return self.failures > 0 and self.live
+
+    def snapshot(self):
+        return {
+            'url': self.url,
+            'latency': self.latency,
+            'failures': self.failures,
+            'live': self.live,
+            'suspect': self.suspect,
+            'downUntil': self.downUntil,
+        }
+
+class endpointPool(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def _state(self, url):
+        try:
+            return self._states[url]
+        except KeyError:
+            self._states[url] = endpointState(url)
+            return self._states[url]
+
+    def ordered(self, urls):
+        # Live endpoints fastest first (unmeasured ones count as fastest so
+        # they get measured, unless they have only ever failed), then
+        # endpoints which are down, soonest to recover first, as a last
+        # resort.
+        with self._lock:
+            states = [self._state(url) for url in urls]
+            live = sorted([s for s in states if s.live], key=lambda s: (s.latency is None and s.failures > 0, s.latency or 0.0))
+            down = sorted([s for s in states if not s.live], key=lambda s: s.downUntil)
+            return [s.url for s in live + down]
+
+    def succeeded(self, url, latency=None):
+        with self._lock:
+            state = self._state(url)
+            state.failures = 0
+            state.downUntil = 0.0
+            if latency is not None:
+                if state.latency is None:
+                    state.latency = latency
+                else:
+                    state.latency = LATENCY_WEIGHT * latency + (1 - LATENCY_WEIGHT) * state.latency
+
+    def suspect(self, url):
+        with self._lock:
+            return self._state(url).suspect
+
+    def failed(self, url):
+        with self._lock:
+            state = self._state(url)
+            state.failures += 1
+            state.downUntil = time.time() + RETRY_DELAY * min(2 ** (state.failures - 1), MAX_BACKOFF)
+
+    def snapshot(self):
+        with self._lock:
+            return dict([(url, state.snapshot()) for (url, state) in self._states.iteritems()])
+
+    def reset(self):
+        with self._lock:
+            self._states.clear()
+
+pool = endpointPool()
@@ -1,5 +1,9 @@
 class ClientError(Exception):
     pass
 
+# Oozie has no record of the job asked about, e.g. because it was purged.
+class JobNotFoundError(ClientError):
+    pass
+
 class ServerError(Exception):
     pass
@@ -1,10 +1,104 @@
+import bz2
+import httplib
+import json
 import os
 import socket
+import StringIO
 import tempfile
+import urllib
 import urlparse
 import webhdfs.webhdfs
+import zlib
 
 from . import errors
+from . import instrumentation
+
+
+
+# Compression schemes we can apply while streaming data into HDFS, and the
+# file extensions Hadoop's input formats use to recognize them.  bzip2 is
+# slower but splittable, so large inputs can still be spread across mappers.
+COMPRESSION_EXTENSIONS = {
+    'gzip': '.gz',
+    'bzip2': '.bz2',
+}
+COMPRESSION_CHUNK_SIZE = 1024 * 1024
+
+def compressedFilename(path, compression):
+    # Append the extension for the given compression scheme unless the path
+    # already carries it.
+    if compression is None:
+        return path
+    try:
+        extension = COMPRESSION_EXTENSIONS[compression]
+    except KeyError:
+        raise errors.ClientError('Unsupported compression "' + str(compression) + '"; expected one of ' + ', '.join(sorted(COMPRESSION_EXTENSIONS)))
+    if path.endswith(extension):
+        return path
+    return path + extension
+
+def isCompressed(path):
+    # Whether the path carries the extension of a compression scheme we
+    # know, in which case its contents are taken to be compressed already.
+    return any([path.endswith(extension) for extension in COMPRESSION_EXTENSIONS.itervalues()])
+
+def _iterChunks(source):
+    while True:
+        chunk = source.read(COMPRESSION_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+def _iterCompressedChunks(source, compression):
+    # Read the source in fixed size pieces and yield compressed data as the
+    # compressor produces it, so we never hold the whole file in memory.
+    if compression == 'gzip':
+        # 16 + MAX_WBITS asks zlib for a gzip header and trailer.
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == 'bzip2':
+        compressor = bz2.BZ2Compressor(9)
+    else:
+        raise errors.ClientError('Unsupported compression "' + str(compression) + '"')
+    for chunk in _iterChunks(source):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _expectStatus(response, body, expectedStatus, action, url):
+    # The httplib counterpart of oozie.expectCode.
+    if response.status == expectedStatus:
+        return
+    message = ' when ' + action + ' at ' + url + '\nMessage was ' + str(response.status) + ':\n' + body
+    if response.status in [401, 403]:
+        raise errors.ClientError('Permission denied' + message)
+    elif response.status >= 400 and response.status < 500:
+        raise errors.ClientError('Malformed input' + message)
+    else:
+        raise errors.ServerError('Unexpected status code' + message)
+
+
+def _nameNodeRequest(host, port, username, method, operation, path, op, arguments=''):
+    # A single timed request to the name node, reported with its status and
+    # byte count.  Returns the response and its body.
+    urlPath = webhdfs.webhdfs.WEBHDFS_CONTEXT_ROOT + urllib.quote('/' + path.lstrip('/')) + '?op=' + op + arguments + '&user.name=' + username
+    with instrumentation.timer('webhdfs', operation, endpoint=host + ':' + str(port)) as t:
+        connection = httplib.HTTPConnection(host, port, timeout=600)
+        try:
+            connection.request(method, urlPath, headers={})
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        t.status = response.status
+        t.bytesIn = len(body)
+    return (response, body)
+
+def _listStatus(host, port, username, path, operation='listdir'):
+    (response, body) = _nameNodeRequest(host, port, username, 'GET', operation, path, 'LISTSTATUS')
+    _expectStatus(response, body, 200, 'listing "' + path + '"', 'http://' + host + ':' + str(port) + webhdfs.webhdfs.WEBHDFS_CONTEXT_ROOT + path)
+    return [status['pathSuffix'] for status in json.loads(body)['FileStatuses']['FileStatus']]
 
 
 
@@ -31,19 +125,20 @@ class client(webhdfs.webhdfs.WebHDFS):
                 namenode_ports.append(50070)
             for namenode_port in namenode_ports:
                 hdfs_username = parsed.username or 'hdfs'
-                # Generate a test WebHDFS object
-                test = webhdfs.webhdfs.WebHDFS(namenode_host=namenode_host, namenode_port=namenode_port, hdfs_username=hdfs_username)
                 try:
-                    # Test the test object.
-                    test.listdir('/')
+                    # Test these parameters by listing the root directory.
+                    _listStatus(namenode_host, namenode_port, hdfs_username, '/', operation='probe')
                     # Test looked valid.  Use those same parameters to initialize our superclass.
                     super(client, self).__init__(namenode_host=namenode_host, namenode_port=namenode_port, hdfs_username=hdfs_username)
                     return
                 # Errors produced when we're unable to retrieve a valid listing using the given parameters.
-                except (KeyError, ValueError, socket.error):
+                except (KeyError, ValueError, socket.error, httplib.HTTPException, errors.ClientError, errors.ServerError):
                     pass
         else:
             raise errors.ClientError('WebHDFS at ' + url + ' appears misconfigured')
+    @property
+    def _endpoint(self):
+        return self.namenode_host + ':' + str(self.namenode_port)
     # Override the webhdfs copy[To|From]Local functions, which erroneously
     # append a leading / to the remote address.
     def copyFromLocal(self, *args, **kwargs):
@@ -53,7 +148,10 @@ class client(webhdfs.webhdfs.WebHDFS):
         except KeyError:
             args = list(args)
             args[1] = args[1].lstrip('/')
-        return super(client, self).copyFromLocal(*args, **kwargs)
+        with instrumentation.timer('webhdfs', 'copyFromLocal', endpoint=self._endpoint) as t:
+            t.bytesOut = os.path.getsize(kwargs.get('source_path', (list(args) + [None])[0]))
+            t.status = super(client, self).copyFromLocal(*args, **kwargs)
+        return t.status
     def copyToLocal(self, *args, **kwargs):
         # First argument is source_path.
         try:
@@ -61,10 +159,72 @@ class client(webhdfs.webhdfs.WebHDFS):
         except KeyError:
             args = list(args)
             args[0] = args[0].lstrip('/')
-        return super(client, self).copyToLocal(*args, **kwargs)
+        with instrumentation.timer('webhdfs', 'copyToLocal', endpoint=self._endpoint) as t:
+            t.status = super(client, self).copyToLocal(*args, **kwargs)
+            t.bytesIn = os.path.getsize(kwargs.get('target_path', (list(args) + [None, None])[1]))
+        return t.status
+    # Our own versions of the remaining WebHDFS operations, so that each is
+    # reported with its status and size.  Like the webhdfs originals, mkdir
+    # and rmdir do not raise on failure; they return the status instead.
+    def mkdir(self, path):
+        return _nameNodeRequest(self.namenode_host, self.namenode_port, self.username, 'PUT', 'mkdir', path, 'MKDIRS')[0].status
+    def rmdir(self, path):
+        return _nameNodeRequest(self.namenode_host, self.namenode_port, self.username, 'DELETE', 'rmdir', path, 'DELETE', '&recursive=true')[0].status
+    def listdir(self, path):
+        return _listStatus(self.namenode_host, self.namenode_port, self.username, path)
+    # Stream an iterable of chunks to the given path using chunked transfer
+    # encoding, so the total size need not be known up front.
+    def writeChunks(self, path, chunks, replication=1):
+        urlPath = webhdfs.webhdfs.WEBHDFS_CONTEXT_ROOT + '/' + path.lstrip('/') + '?op=CREATE&overwrite=true&user.name=' + self.username
+        with instrumentation.timer('webhdfs', 'writeChunks', endpoint=self._endpoint) as t:
+            nameNodeClient = httplib.HTTPConnection(self.namenode_host, self.namenode_port, timeout=600)
+            try:
+                nameNodeClient.request('PUT', urlPath, headers={})
+                response = nameNodeClient.getresponse()
+                body = response.read()
+                redirect = response.msg.get('location')
+            finally:
+                nameNodeClient.close()
+            t.status = response.status
+            # The name node answers a CREATE by redirecting us to a data node.
+            _expectStatus(response, body, 307, 'creating "' + path + '"', 'http://' + self._endpoint + urlPath)
+            if redirect is None:
+                raise errors.ServerError('WebHDFS did not redirect file creation of "' + path + '" to a data node')
+            parsed = urlparse.urlparse(redirect)
+            dataNodeClient = httplib.HTTPConnection(parsed.hostname, parsed.port, timeout=600)
+            try:
+                dataNodeClient.putrequest('PUT', parsed.path + '?' + parsed.query + '&replication=' + str(replication))
+                dataNodeClient.putheader('Content-Type', 'application/octet-stream')
+                dataNodeClient.putheader('Transfer-Encoding', 'chunked')
+                dataNodeClient.endheaders()
+                for chunk in chunks:
+                    if chunk:
+                        dataNodeClient.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+                        t.bytesOut += len(chunk)
+                dataNodeClient.send('0\r\n\r\n')
+                response = dataNodeClient.getresponse()
+                response.read()
+                t.status = response.status
+            finally:
+                dataNodeClient.close()
+        return t.status
     # Create helper functions which read and write buffers instead of
     # requiring filenames.
-    def write(self, path, data):
+    def write(self, path, data, compression=None):
+        # When compression is requested, data may also be a file-like object
+        # opened in binary mode; it is compressed on the fly as it is sent and the target
+        # is renamed to carry the matching extension.  A path which already
+        # carries a compression extension is taken to hold compressed data,
+        # which is written unchanged.
+        # HDFS stores bytes; text is written as UTF-8.
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if compression is not None:
+            if isinstance(data, basestring):
+                data = StringIO.StringIO(data)
+            if isCompressed(path):
+                return self.writeChunks(path, _iterChunks(data))
+            return self.writeChunks(compressedFilename(path, compression), _iterCompressedChunks(data, compression))
         filename = tempfile.NamedTemporaryFile(delete=False).name
         try:
             with open(filename, 'wb') as f:
@@ -0,0 +1,179 @@
+import bisect
+import logging
+import threading
+import time
+
+
+
+# Upper bounds (in seconds) of the latency histogram buckets.  Anything slower
+# than the last bound lands in an overflow bucket.
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+
+
+class histogram(object):
+    # A fixed bucket histogram which also tracks count, sum, min and max, so
+    # that recording an observation is cheap no matter how many we have seen.
+    def __init__(self, buckets=None):
+        self.buckets = list(buckets or LATENCY_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def percentile(self, p):
+        # Estimate the p-th percentile as the upper bound of the bucket which
+        # contains it.  The overflow bucket reports the largest observation.
+        if self.count == 0:
+            return None
+        threshold = self.count * p / 100.0
+        seen = 0
+        for (i, c) in enumerate(self.counts):
+            seen += c
+            if seen >= threshold and c > 0:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+class metricRegistry(object):
+    # In-process store of counters and histograms, keyed by name.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self._lock:
+            try:
+                h = self._histograms[name]
+            except KeyError:
+                h = self._histograms[name] = histogram()
+            h.observe(value)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def histogram(self, name):
+        with self._lock:
+            return self._histograms.get(name)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'histograms': dict([(name, h.snapshot()) for (name, h) in self._histograms.iteritems()]),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+# The registry every client call reports into.
+registry = metricRegistry()
+
+# Callables which receive every recorded event as a dict; use these to export
+# events to an external metrics system.
+_hooks = []
+
+def addHook(callback):
+    _hooks.append(callback)
+
+def removeHook(callback):
+    try:
+        _hooks.remove(callback)
+    except ValueError:
+        pass
+
+def record(service, operation, endpoint=None, status=None, latency=None, bytesIn=0, bytesOut=0, retries=0):
+    # Record a single call against a remote service (or a phase of local work)
+    # in the registry and hand it to every hook.
+    event = {
+        'service': service,
+        'operation': operation,
+        'endpoint': endpoint,
+        'status': status,
+        'latency': latency,
+        'bytesIn': bytesIn,
+        'bytesOut': bytesOut,
+        'retries': retries,
+    }
+    name = service + '.' + operation
+    registry.increment(name + '.calls')
+    if status is not None:
+        registry.increment(name + '.status.' + str(status))
+    if latency is not None:
+        registry.observe(name + '.latency', latency)
+    if bytesIn:
+        registry.increment(name + '.bytesIn', bytesIn)
+    if bytesOut:
+        registry.increment(name + '.bytesOut', bytesOut)
+    if retries:
+        registry.increment(name + '.retries', retries)
+    for hook in list(_hooks):
+        try:
+            hook(event)
+        except KeyboardInterrupt:
+            raise
+        except Exception:
+            # A broken exporter must never break the call being measured.
+            logging.exception('Instrumentation hook ' + repr(hook) + ' failed')
+    return event
+
+class timer(object):
+    # Context manager which times a block and records it on exit.  The caller
+    # may fill in status, byte counts and retries on the timer as they become
+    # known; an exception escaping the block is recorded as status "error"
+    # unless a status was already set.
+    def __init__(self, service, operation, endpoint=None):
+        self.service = service
+        self.operation = operation
+        self.endpoint = endpoint
+        self.status = None
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.retries = 0
+        self.latency = None
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.latency = time.time() - self._start
+        if excType is not None and self.status is None:
+            self.status = 'error'
+        record(self.service, self.operation, endpoint=self.endpoint, status=self.status, latency=self.latency, bytesIn=self.bytesIn, bytesOut=self.bytesOut, retries=self.retries)
+        return False
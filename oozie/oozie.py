@@ -1,11 +1,18 @@
+import errno
 import logging
 import lxml.etree
 import os
 import os.path
+import re
 import requests
+import socket
+import time
 import urllib2
 
+from . import endpoints
 from . import errors
+from . import instrumentation
+from . import timeline
 
 # Attempt to coerce a given input to an XML buffer
 def xmlFromInput(inputData):
@@ -26,6 +33,12 @@ def expectCode(response, expectedCode, action):
         else:
             raise errors.ServerError('Unexpected status code when ' + action + ' at ' + response.url + '\nMessage was ' + str(response.status_code) + ':\n' + response.text)
 
+def expectJob(response, jobId, action):
+    # Oozie answers E0604 for a job id it has no record of.
+    if response.status_code == 400 and response.headers.get('oozie-error-code') == 'E0604':
+        raise errors.JobNotFoundError('No such job ' + jobId + ' when ' + action + ' at ' + response.url)
+    expectCode(response, 200, action)
+
 def expectJsonFields(response, expectedFields, action):
     try:
         assert response.json is not None
@@ -36,52 +49,308 @@ def expectJsonFields(response, expectedFields, action):
 
 
 
+# Once a job reaches one of these statuses it will not change again.
+TERMINAL_STATUSES = frozenset(['SUCCEEDED', 'KILLED', 'FAILED'])
+
+# Bytes read from the network at a time while streaming job logs.
+LOG_CHUNK_SIZE = 64 * 1024
+
+# Default seconds to wait for an Oozie server to accept a connection or to
+# send more of its response before giving up on it.
+TIMEOUT = 60.0
+# Seconds a server coming back from back-off gets to answer a healthcheck
+# before it is trusted with a real request.
+PROBE_TIMEOUT = 5.0
+
+def _connectionRefused(e):
+    # requests wraps the socket error which refused the connection.
+    reason = (list(e.args) + [None])[0]
+    return isinstance(reason, socket.error) and reason.errno == errno.ECONNREFUSED
+
+def _closeResponse(response):
+    # This version of requests has no Response.close().  A body read to the
+    # end has already handed its connection back to the pool; closing the
+    # underlying httplib response frees the socket behind one which was not.
+    original = getattr(response.raw, '_original_response', None)
+    if original is not None:
+        original.close()
+
+# Oozie log lines start with a timestamp in the format its logfilter takes.
+LOG_TIME_PATTERN = re.compile(r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3})')
+
+def _logTime(line):
+    match = LOG_TIME_PATTERN.match(line)
+    return None if match is None else match.group(1)
+
+def _iterLines(response, t):
+    # Split a streamed response into (line, complete) pairs, counting the
+    # bytes read on the timer.  Only the last line can be incomplete.
+    buffered = ''
+    for chunk in response.iter_content(LOG_CHUNK_SIZE):
+        t.bytesIn += len(chunk)
+        buffered += chunk
+        if '\n' in buffered:
+            lines = buffered.split('\n')
+            buffered = lines.pop()
+            for line in lines:
+                yield (line, True)
+    if buffered:
+        yield (buffered, False)
+
+class logStream(object):
+    # Iterates over the lines of a job's log as they arrive, starting offset
+    # bytes in.  offset advances past every line yielded, so a stream (or a
+    # new one created with the same offset) only ever yields new lines.
+    # With follow=True, iteration keeps polling every interval seconds until
+    # the job finishes.
+    #
+    # Oozie ignores the Range header, so to avoid downloading the whole log
+    # on every poll, later fetches ask Oozie (4.2 and later) for only the
+    # lines logged since the timestamp of the last line seen, using the
+    # logfilter start= parameter, and drop the lines at that timestamp which
+    # were already yielded.  Servers which honor Range (e.g. behind a
+    # range-capable proxy) are sent Range instead, and servers which honor
+    # neither send the whole log, from which the part already seen is
+    # skipped.  logFilter is any further logfilter to apply, such as
+    # "loglevel=ERROR"; offsets then count within the filtered log, so keep
+    # it fixed for the life of a stream, and leave start= and recent= to us.
+    def __init__(self, client, jobId, offset=0, follow=False, interval=10, logFilter=None):
+        self._client = client
+        self.jobId = jobId
+        self.offset = offset
+        self.follow = follow
+        self.interval = interval
+        self.logFilter = logFilter
+        # Whether the server honors Range and logfilter start=; None until
+        # we find out.
+        self._rangeHonored = None
+        self._startHonored = None
+        # Timestamp of the last timestamped line yielded, and how many lines
+        # have been yielded from that one on.
+        self._since = None
+        self._sinceLines = 0
+    
+    def _remember(self, line):
+        stamp = _logTime(line)
+        if stamp is not None and stamp != self._since:
+            self._since = stamp
+            self._sinceLines = 1
+        elif self._since is not None:
+            self._sinceLines += 1
+    
+    def _fetch(self, partial):
+        # Yield the lines past offset.  A final line with no newline yet is
+        # only yielded if partial is set; otherwise it is left to be fetched
+        # whole next time.
+        headers = {}
+        filters = [f for f in (self.logFilter or '').split(';') if f]
+        since = None
+        if self.offset > 0 and self._rangeHonored is not False:
+            headers['Range'] = 'bytes=' + str(self.offset) + '-'
+        elif self.offset > 0 and self._startHonored is not False and self._since is not None:
+            since = self._since
+            filters = [f for f in filters if not f.startswith('start=')] + ['start=' + since]
+        params = {'show': 'log'}
+        if len(filters) > 0:
+            params['logfilter'] = ';'.join(filters)
+        response = self._client._request(
+            'get', 'log', 'job/' + self.jobId,
+            params  = params,
+            headers = headers,
+            prefetch = False,
+        )
+        try:
+            if response.status_code == 416:
+                # Nothing past offset yet.
+                self._rangeHonored = True
+                return
+            if response.status_code != 206:
+                expectCode(response, 200, 'retrieving job log')
+            if 'Range' in headers:
+                self._rangeHonored = (response.status_code == 206)
+            # A server which ignored both Range and start= sent the whole
+            # log; skip the bytes of it we have already yielded.
+            skipTo = 0 if (response.status_code == 206 or since is not None) else self.offset
+            drop = 0
+            position = 0
+            # The request above is recorded before the body is read, so
+            # record the bytes and time spent streaming it separately.
+            endpoint = response.url.split('/' + self._client._version + '/')[0]
+            with instrumentation.timer('oozie', 'log.read', endpoint=endpoint) as t:
+                t.status = response.status_code
+                for (line, complete) in _iterLines(response, t):
+                    if not complete and not partial:
+                        break
+                    lineStart = position
+                    position += len(line) + int(complete)
+                    if since is not None and lineStart == 0:
+                        stamp = _logTime(line)
+                        if stamp is None or stamp < since:
+                            # Oozie before 4.2 ignores logfilter.
+                            self._startHonored = False
+                            skipTo = self.offset
+                        else:
+                            self._startHonored = True
+                            drop = self._sinceLines if stamp == since else 0
+                    if drop > 0:
+                        drop -= 1
+                        continue
+                    if position <= skipTo:
+                        continue
+                    if lineStart < skipTo:
+                        line = line[skipTo - lineStart:]
+                    self.offset += len(line) + int(complete)
+                    self._remember(line)
+                    yield line
+        finally:
+            _closeResponse(response)
+    
+    def poll(self):
+        # Fetch whatever complete lines have been logged since the last poll,
+        # without waiting.  Useful for watching many jobs from one thread.
+        return list(self._fetch(partial=False))
+    
+    def __iter__(self):
+        while True:
+            # Check the status before fetching, so that anything logged
+            # before the job finished is included in the final fetch.
+            last = not self.follow or self._client.status(self.jobId) in TERMINAL_STATUSES
+            for line in self._fetch(partial=last):
+                yield line
+            if last:
+                return
+            time.sleep(self.interval)
+
 class client(object):
-    def __init__(self, url=None):
+    def __init__(self, url=None, timeout=TIMEOUT):
+        # url may be a single Oozie URL, a list of them, or a comma separated
+        # string of them for an HA installation.  Requests go to whichever
+        # server has been answering fastest; idempotent requests fail over to
+        # the others on connection errors, timeouts or 5xx responses, and
+        # other requests only when a server refuses the connection.
         if url is None:
             url = os.environ.get('OOZIE_URL')
         if url is None:
             raise errors.ClientError('No Oozie URL provided and none set in environment OOZIE_URL')
-        self._url = url.rstrip('/')
+        if isinstance(url, basestring):
+            url = url.split(',')
+        self._urls = [u.strip().rstrip('/') for u in url if u.strip()]
+        if len(self._urls) == 0:
+            raise errors.ClientError('No Oozie URL provided')
+        self._url = ','.join(self._urls)
         self._version = 'v1'
+        self._timeout = timeout
     
-    def healthcheck(self):
-        response = requests.get(
-            url = '/'.join([self._url, self._version, 'admin/status'])
-        )
+    # Every call to the Oozie web service goes through here so that it is
+    # routed to a healthy server, timed, and reported to the instrumentation
+    # registry and hooks.  GET requests are idempotent unless told otherwise.
+    # Unless probe is off, a server whose back-off has expired must pass a
+    # healthcheck before it is sent the request.
+    def _request(self, method, operation, path, idempotent=None, urls=None, probe=True, **kwargs):
+        if idempotent is None:
+            idempotent = (method == 'get')
+        kwargs.setdefault('timeout', self._timeout)
+        attempts = endpoints.pool.ordered(urls or self._urls)
+        for (attempt, url) in enumerate(attempts):
+            last = (attempt == len(attempts) - 1)
+            if probe and endpoints.pool.suspect(url):
+                try:
+                    self._healthcheckEndpoint(url, timeout=min(PROBE_TIMEOUT, self._timeout or PROBE_TIMEOUT))
+                except errors.ClientError:
+                    # It answered, if not the way we hoped.
+                    pass
+                except (errors.ServerError, requests.exceptions.RequestException) as e:
+                    if last:
+                        raise errors.ServerError('No Oozie server available when ' + operation + '; ' + url + ' failed its healthcheck: ' + str(e))
+                    logging.warning('Oozie server at ' + url + ' failed its healthcheck; trying ' + attempts[attempt + 1])
+                    continue
+            response = None
+            with instrumentation.timer('oozie', operation, endpoint=url) as t:
+                t.retries = attempt
+                t.bytesOut = len(kwargs.get('data') or '')
+                try:
+                    response = getattr(requests, method)(
+                        url = '/'.join([url, self._version, path]),
+                        **kwargs
+                    )
+                    t.status = response.status_code
+                    # Streamed responses are left for the caller to read.
+                    if kwargs.get('prefetch', True):
+                        t.bytesIn = len(response.content or '')
+                except requests.exceptions.RequestException as e:
+                    t.status = 'error'
+                    endpoints.pool.failed(url)
+                    # A refused connection never reached the server, so even
+                    # a non-idempotent request is safe to send elsewhere.
+                    if last or not (idempotent or _connectionRefused(e)):
+                        raise
+            if response is not None and response.status_code < 500:
+                endpoints.pool.succeeded(url, t.latency)
+                return response
+            if response is not None:
+                endpoints.pool.failed(url)
+                if last or not idempotent:
+                    return response
+                _closeResponse(response)
+            logging.warning('Oozie server at ' + url + ' failed when ' + operation + '; trying ' + attempts[attempt + 1])
+    
+    def _healthcheckEndpoint(self, url, timeout=None):
+        response = self._request('get', 'healthcheck', 'admin/status', urls=[url], probe=False, timeout=timeout or self._timeout)
         try:
             expectCode(response, 200, 'performing healthcheck')
             expectJsonFields(response, ['systemMode'], 'performing healthcheck')
             assert response.json['systemMode'] == 'NORMAL'
-            logging.info('Oozie installation at ' + self._url + ' appears operational')
+            logging.info('Oozie installation at ' + url + ' appears operational')
             return True
         except AssertionError:
-            raise errors.ServerError('Oozie server reports ' + response.json['systemMode'])
+            # A server in safe mode answers but cannot take jobs; route
+            # around it like any other failed server.
+            endpoints.pool.failed(url)
+            raise errors.ServerError('Oozie server at ' + url + ' reports ' + response.json['systemMode'])
         except ValueError as e:
             raise errors.ClientError(e.message)
         except urllib2.HTTPError as e:
             raise errors.ClientError('HTTP Error ' + str(e.getcode()) + ': ' + e.msg + ' ' + e.geturl())
     
+    def healthcheck(self):
+        # Probe every configured server, updating the health state shared by
+        # all clients.  Succeeds if any server is operational.
+        failure = None
+        healthy = False
+        for url in self._urls:
+            try:
+                healthy = self._healthcheckEndpoint(url) or healthy
+            except (errors.ClientError, errors.ServerError, requests.exceptions.RequestException) as e:
+                logging.warning('Oozie installation at ' + url + ' failed healthcheck: ' + str(e))
+                failure = e
+        if not healthy:
+            raise failure
+        return True
+    
     def config(self):
-        response = requests.get(
-            url = '/'.join([self._url, self._version, 'admin/configuration']),
-        )
+        response = self._request('get', 'config', 'admin/configuration')
         expectCode(response, 200, 'retrieving Oozie configuration')
         expectJsonFields(response, [], 'retrieving Oozie configuration')
         return response.json
     
-    def list(self):
-        response = requests.get(
-            url = '/'.join([self._url, self._version, 'jobs']),
-        )
+    def list(self, filter=None, offset=None, length=None):
+        # filter is a dict such as {'name': 'myWorkflow', 'status': 'RUNNING'}.
+        params = {}
+        if filter:
+            params['filter'] = ';'.join([k + '=' + v for (k, v) in sorted(filter.iteritems())])
+        if offset is not None:
+            params['offset'] = offset
+        if length is not None:
+            params['len'] = length
+        response = self._request('get', 'list', 'jobs', params=params)
         expectCode(response, 200, 'listing jobs')
         expectJsonFields(response, ['workflows'], 'listing jobs')
         return [wf['id'] for wf in response.json['workflows']]
     
     # 
     def submit(self, configuration):
-        response = requests.post(
-            url     = '/'.join([self._url, self._version, 'jobs']),
+        response = self._request(
+            'post', 'submit', 'jobs',
             data    = xmlFromInput(configuration),
             headers = {'content-type': 'application/xml'},
         )
@@ -90,44 +359,75 @@ class client(object):
         return response.json['id']
     
     def run(self, jobId):
-        response = requests.put(
-            url    = '/'.join([self._url, self._version, 'job', jobId]),
+        response = self._request(
+            'put', 'run', 'job/' + jobId,
             params = {'action': 'start'},
         )
         expectCode(response, 200, 'running job')
         return True
     
     def suspend(self, jobId):
-        response = requests.put(
-            url    = '/'.join([self._url, self._version, 'job', jobId]),
+        response = self._request(
+            'put', 'suspend', 'job/' + jobId,
             params = {'action': 'suspend'},
         )
         expectCode(response, 200, 'suspending job')
         return True
     
     def resume(self, jobId):
-        response = requests.put(
-            url    = '/'.join([self._url, self._version, 'job', jobId]),
+        response = self._request(
+            'put', 'resume', 'job/' + jobId,
             params = {'action': 'resume'},
         )
         expectCode(response, 200, 'resuming job')
         return True
     
     def status(self, jobId):
-        response = requests.get(
-            url = '/'.join([self._url, self._version, 'job', jobId]),
-        )
-        expectCode(response, 200, 'querying job status')
+        response = self._request('get', 'status', 'job/' + jobId)
+        expectJob(response, jobId, 'querying job status')
         expectJsonFields(response, ['status'], 'querying job status')
         return response.json['status']
     
     def error(self, jobId):
-        response = requests.get(
-            url = '/'.join([self._url, self._version, 'job', jobId]),
-        )
+        response = self._request('get', 'error', 'job/' + jobId)
         expectCode(response, 200, 'listing job errors')
         expectJsonFields(response, ['actions'], 'listing job errors')
         for action in response.json['actions']:
             if action['errorMessage'] is not None:
                 return action['errorMessage']
         return None
+    
+    def definition(self, jobId):
+        # The workflow XML the job is running.
+        response = self._request('get', 'definition', 'job/' + jobId, params={'show': 'definition'})
+        expectCode(response, 200, 'retrieving job definition')
+        return response.content
+    
+    def profile(self, jobId):
+        # Per-action timeline of a job, with its critical path.  The
+        # workflow definition tells us which actions waited for which; if
+        # it is unavailable the timeline is inferred from the actions alone.
+        response = self._request('get', 'profile', 'job/' + jobId)
+        expectCode(response, 200, 'profiling job')
+        expectJsonFields(response, ['actions'], 'profiling job')
+        try:
+            definition = self.definition(jobId)
+        except (errors.ClientError, errors.ServerError) as e:
+            logging.warning('Profiling job ' + jobId + ' without its definition: ' + str(e))
+            definition = None
+        return timeline.buildProfile(response.json, definition)
+    
+    def profileRuns(self, name, count=20):
+        # Profile the most recent finished runs of the named workflow and
+        # summarize them action by action.
+        profiles = []
+        for jobId in self.list(filter={'name': name}, length=count):
+            profile = self.profile(jobId)
+            if profile['end'] is not None:
+                profiles.append(profile)
+        return timeline.aggregateProfiles(profiles)
+    
+    def log(self, jobId, offset=0, follow=False, interval=10, logFilter=None):
+        # Stream the job's log line by line; see logStream for how polls
+        # avoid fetching the whole log again.
+        return logStream(self, jobId, offset=offset, follow=follow, interval=interval, logFilter=logFilter)
@@ -0,0 +1,173 @@
+import json
+import logging
+import requests
+import sqlite3
+import threading
+import time
+
+from . import errors
+
+
+
+# A local record of the jobs this machine has submitted, so that a restarted
+# process can pick up monitoring where it left off without listing every job
+# on the Oozie server.  Set OOZIE_JOB_REGISTRY to a file path to have
+# jobConfiguration.submit() record jobs automatically.  Every failure to read
+# or write the registry is raised as a ClientError.
+
+# Status recorded for jobs Oozie no longer knows about (e.g. purged ones).
+UNKNOWN_STATUS = 'UNKNOWN'
+
+_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        appPath TEXT,
+        outputPath TEXT,
+        oozieUrl TEXT,
+        parameters TEXT,
+        status TEXT,
+        finished INTEGER NOT NULL DEFAULT 0,
+        submitted REAL NOT NULL,
+        updated REAL NOT NULL
+    )''',
+    # Monitoring only ever asks for unfinished jobs, in submission order.
+    'CREATE INDEX IF NOT EXISTS jobs_finished_submitted ON jobs (finished, submitted)',
+]
+
+
+
+class jobRegistry(object):
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            # Write-ahead logging keeps the file consistent if we crash
+            # mid-write and lets other processes read while we write.
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            with self._connection:
+                for statement in _SCHEMA:
+                    self._connection.execute(statement)
+        except sqlite3.Error as e:
+            raise errors.ClientError('Unable to open job registry "' + path + '": ' + str(e))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _execute(self, statement, arguments=()):
+        try:
+            with self._lock:
+                with self._connection:
+                    return self._connection.execute(statement, arguments).fetchall()
+        except sqlite3.Error as e:
+            raise errors.ClientError('Unable to use job registry "' + self.path + '": ' + str(e))
+
+    def _handle(self, row):
+        # Imported here because the package imports this module first.
+        from . import jobHandle
+        return jobHandle(*row)
+
+    def record(self, handle, parameters=None):
+        # Remember a newly submitted job, along with the parameters it was
+        # submitted with.
+        from . import TERMINAL_STATUSES
+        try:
+            encoded = json.dumps(parameters or {})
+        except (TypeError, ValueError) as e:
+            raise errors.ClientError('Unable to record parameters of job ' + handle.id + ' in job registry: ' + str(e))
+        now = time.time()
+        self._execute(
+            'INSERT OR REPLACE INTO jobs (id, appPath, outputPath, oozieUrl, parameters, status, finished, submitted, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (handle.id, handle.appPath, handle.outputPath, handle.oozieUrl, encoded, handle.lastStatus, int(handle.lastStatus in TERMINAL_STATUSES), now, now),
+        )
+
+    def update(self, jobId, status, finished=None):
+        # finished defaults to whether status is final.
+        from . import TERMINAL_STATUSES
+        if finished is None:
+            finished = status in TERMINAL_STATUSES
+        self._execute(
+            'UPDATE jobs SET status = ?, finished = ?, updated = ? WHERE id = ?',
+            (status, int(finished), time.time(), jobId),
+        )
+
+    def get(self, jobId):
+        rows = self._execute('SELECT id, appPath, outputPath, status, oozieUrl FROM jobs WHERE id = ?', (jobId,))
+        if len(rows) == 0:
+            return None
+        return self._handle(rows[0])
+
+    def parameters(self, jobId):
+        rows = self._execute('SELECT parameters FROM jobs WHERE id = ?', (jobId,))
+        if len(rows) == 0:
+            return None
+        return json.loads(rows[0][0] or '{}')
+
+    def active(self):
+        # Handles for every job not yet known to have finished, oldest first.
+        # Served by the (finished, submitted) index; Oozie is not consulted.
+        return [self._handle(row) for row in self._execute('SELECT id, appPath, outputPath, status, oozieUrl FROM jobs WHERE finished = 0 ORDER BY submitted')]
+
+    def refresh(self):
+        # Ask Oozie about each unfinished job, record what it says, and return
+        # the handles which are still unfinished.  A job Oozie says does not
+        # exist (e.g. one purged from its database) is recorded as finished
+        # with status UNKNOWN so we stop asking.  Any other error, including
+        # being refused permission, leaves the job active to be asked about
+        # next time.
+        active = []
+        for handle in self.active():
+            try:
+                self.update(handle.id, handle.refresh())
+            except errors.JobNotFoundError as e:
+                logging.warning('Giving up on job ' + handle.id + ': ' + str(e))
+                handle.lastStatus = UNKNOWN_STATUS
+                self.update(handle.id, UNKNOWN_STATUS, finished=True)
+                continue
+            except (errors.ClientError, errors.ServerError, requests.exceptions.RequestException) as e:
+                logging.warning('Unable to refresh job ' + handle.id + ': ' + str(e))
+            if not handle.finished:
+                active.append(handle)
+        return active
+
+    def prune(self, olderThan):
+        # Forget finished jobs last updated before the given timestamp.
+        self._execute('DELETE FROM jobs WHERE finished = 1 AND updated < ?', (olderThan,))
+
+
+
+# One registry per file per process; every job submitted from this process
+# shares its connection.  A registry which could not be opened is not tried
+# again, so callers polling job status do not retry it on every call.
+_registries = {}
+_failures = {}
+_registriesLock = threading.Lock()
+
+def shared(path):
+    with _registriesLock:
+        if path in _failures:
+            raise _failures[path]
+        try:
+            return _registries[path]
+        except KeyError:
+            try:
+                _registries[path] = jobRegistry(path)
+            except errors.ClientError as e:
+                _failures[path] = e
+                raise
+            return _registries[path]
+
+def optional(path):
+    # The shared registry for path, or None if it cannot be opened, in which
+    # case a warning is logged the first time only.
+    try:
+        return shared(path)
+    except errors.ClientError as e:
+        with _registriesLock:
+            warned = getattr(e, 'warned', False)
+            e.warned = True
+        if not warned:
+            logging.warning(str(e) + '; jobs will not be recorded')
+        return None
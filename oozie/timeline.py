@@ -0,0 +1,178 @@
+import calendar
+import email.utils
+import lxml.etree
+
+
+
+# Turn the job information Oozie reports into a per-action timeline: when
+# each action became ready to run, how long it waited, how long it ran, how
+# often it was retried, and which chain of actions determined the job's
+# total run time (the critical path).
+
+
+
+def parseTime(value):
+    # Oozie reports times like "Tue, 19 Mar 2013 22:16:04 GMT"; return them
+    # as seconds since the epoch, or None.
+    if not value:
+        return None
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return float(calendar.timegm(parsed[:9]) - (parsed[9] or 0))
+
+def _difference(end, start):
+    if end is None or start is None:
+        return None
+    return max(0.0, end - start)
+
+def _localName(node):
+    return node.tag.split('}')[-1]
+
+def parseDefinition(definition):
+    # Map each action in a workflow definition (the XML Oozie returns for
+    # show=definition) to the actions which can lead to it, as a set of
+    # (action, first node after that action) pairs.  Control nodes (forks,
+    # joins and decisions) are followed through, so an action after a join
+    # has every action feeding the join as a predecessor.
+    root = lxml.etree.fromstring(definition)
+    kinds = {}
+    successors = {}
+    for node in root.iterchildren(tag=lxml.etree.Element):
+        kind = _localName(node)
+        name = node.get('name')
+        if name is None:
+            continue
+        kinds[name] = kind
+        targets = []
+        for child in node.iter(tag=lxml.etree.Element):
+            if _localName(child) in ['ok', 'error', 'case', 'default'] and child.get('to') is not None:
+                targets.append(child.get('to'))
+            elif _localName(child) == 'path' and child.get('start') is not None:
+                targets.append(child.get('start'))
+        if kind == 'join' and node.get('to') is not None:
+            targets.append(node.get('to'))
+        successors[name] = targets
+    predecessors = {}
+    for (name, kind) in kinds.iteritems():
+        if kind != 'action':
+            continue
+        for first in successors[name]:
+            pending = [first]
+            seen = set()
+            while len(pending) > 0:
+                target = pending.pop()
+                if target in seen:
+                    continue
+                seen.add(target)
+                if kinds.get(target) == 'action':
+                    predecessors.setdefault(target, set()).add((name, first))
+                elif kinds.get(target) in ['fork', 'join', 'decision']:
+                    pending.extend(successors[target])
+    return predecessors
+
+def buildProfile(job, definition=None):
+    # job is the JSON document Oozie returns for a workflow job, and
+    # definition the workflow XML it ran, if known.
+    jobStart = parseTime(job.get('startTime')) or parseTime(job.get('createdTime'))
+    jobEnd = parseTime(job.get('endTime'))
+    actions = []
+    for action in job.get('actions') or []:
+        actions.append({
+            'name': action.get('name'),
+            'type': action.get('type'),
+            'status': action.get('status'),
+            'externalId': action.get('externalId'),
+            'transition': action.get('transition'),
+            'retries': (action.get('retries') or 0) + (action.get('userRetryCount') or 0),
+            'start': parseTime(action.get('startTime')),
+            'end': parseTime(action.get('endTime')),
+        })
+    byName = dict([(a['name'], a) for a in actions])
+    edges = None if definition is None else parseDefinition(definition)
+    for a in actions:
+        # An action is ready once every action that transitioned to it has
+        # ended.
+        if edges is not None:
+            # Count an edge only if the action took it.
+            predecessors = [byName[name] for (name, first) in edges.get(a['name'], ()) if name in byName and byName[name]['end'] is not None and byName[name]['transition'] in [None, first]]
+        else:
+            # Without the definition we only know transitions straight from
+            # one action to the next.  Anything else went through a fork or
+            # join, so fall back to the last such action to end before this
+            # one started.
+            predecessors = [p for p in actions if p['transition'] == a['name'] and p['end'] is not None]
+            if len(predecessors) == 0 and a['start'] is not None:
+                earlier = [p for p in actions if p is not a and p['transition'] not in byName and p['end'] is not None and p['end'] <= a['start']]
+                if len(earlier) > 0:
+                    predecessors = [max(earlier, key=lambda p: p['end'])]
+        if len(predecessors) > 0:
+            latest = max(predecessors, key=lambda p: p['end'])
+            a['predecessor'] = latest['name']
+            a['ready'] = latest['end']
+        else:
+            a['predecessor'] = None
+            a['ready'] = jobStart
+        a['queueWait'] = _difference(a['start'], a['ready'])
+        a['runTime'] = _difference(a['end'], a['start'])
+    # The critical path ends with the last action to finish and follows
+    # each action back to the predecessor it waited for.
+    criticalPath = []
+    finished = [a for a in actions if a['end'] is not None]
+    current = max(finished, key=lambda a: a['end']) if len(finished) > 0 else None
+    while current is not None and current['name'] not in criticalPath:
+        criticalPath.insert(0, current['name'])
+        current = byName.get(current['predecessor'])
+    for a in actions:
+        a['critical'] = a['name'] in criticalPath
+    onPath = [byName[name] for name in criticalPath]
+    slowest = max(onPath, key=lambda a: (a['queueWait'] or 0) + (a['runTime'] or 0)) if len(onPath) > 0 else None
+    return {
+        'id': job.get('id'),
+        'appName': job.get('appName'),
+        'status': job.get('status'),
+        'start': jobStart,
+        'end': jobEnd,
+        'duration': _difference(jobEnd, jobStart),
+        'actions': sorted(actions, key=lambda a: (a['start'] is None, a['start'])),
+        'criticalPath': criticalPath,
+        'slowest': None if slowest is None else slowest['name'],
+    }
+
+
+
+def _summarize(values):
+    values = sorted([v for v in values if v is not None])
+    if len(values) == 0:
+        return {'count': 0, 'mean': None, 'min': None, 'median': None, 'max': None}
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'min': values[0],
+        'median': values[len(values) // 2],
+        'max': values[-1],
+    }
+
+def aggregateProfiles(profiles):
+    # Summarize many runs of the same workflow, action by action.
+    byAction = {}
+    for profile in profiles:
+        for a in profile['actions']:
+            byAction.setdefault(a['name'], []).append(a)
+    actions = {}
+    for (name, runs) in byAction.iteritems():
+        actions[name] = {
+            'type': runs[0]['type'],
+            'runs': len(runs),
+            'failures': len([a for a in runs if a['status'] in ['ERROR', 'FAILED', 'KILLED']]),
+            'retries': sum([a['retries'] for a in runs]),
+            'critical': len([a for a in runs if a['critical']]),
+            'queueWait': _summarize([a['queueWait'] for a in runs]),
+            'runTime': _summarize([a['runTime'] for a in runs]),
+        }
+    return {
+        'runs': len(profiles),
+        'appNames': sorted(set([p['appName'] for p in profiles])),
+        'duration': _summarize([p['duration'] for p in profiles]),
+        'actions': actions,
+    }
@@ -32,10 +32,11 @@ setuptools.setup(
         'nose',
     ],
     test_suite='nose.collector',
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks', 'tests']),
     scripts=[
         # Real useful things
         'bin/oozie-run',
+        'bin/oozie-profile',
         
         # Silly examples which really shouldn't be scripts, but I'm lazy
         'bin/oozie-echo',
@@ -0,0 +1,118 @@
+import socket
+import time
+import unittest
+
+import requests
+
+import oozie.endpoints
+import oozie.oozie
+
+from benchmarks import fakeservers
+
+
+
+class endpointPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = oozie.endpoints.endpointPool()
+
+    def testUnmeasuredKeepOrder(self):
+        self.assertEqual(self.pool.ordered(['a', 'b', 'c']), ['a', 'b', 'c'])
+
+    def testFastestFirst(self):
+        self.pool.succeeded('a', 0.3)
+        self.pool.succeeded('b', 0.1)
+        self.pool.succeeded('c', 0.2)
+        self.assertEqual(self.pool.ordered(['a', 'b', 'c']), ['b', 'c', 'a'])
+
+    def testLatencyIsMovingAverage(self):
+        self.pool.succeeded('a', 1.0)
+        self.pool.succeeded('a', 0.0)
+        self.assertAlmostEqual(self.pool.snapshot()['a']['latency'], 1 - oozie.endpoints.LATENCY_WEIGHT)
+
+    def testDownLastSoonestFirst(self):
+        self.pool.succeeded('a', 0.1)
+        self.pool.failed('b')
+        self.pool.failed('c')
+        self.pool.failed('c')
+        self.pool.failed('a')
+        self.assertEqual(self.pool.ordered(['a', 'b', 'c', 'd']), ['d', 'b', 'a', 'c'])
+
+    def testBackoffDoublesUpToLimit(self):
+        delays = []
+        for i in xrange(oozie.endpoints.MAX_BACKOFF):
+            self.pool.failed('a')
+            delays.append(self.pool.snapshot()['a']['downUntil'] - time.time())
+        expected = [oozie.endpoints.RETRY_DELAY * min(2 ** i, oozie.endpoints.MAX_BACKOFF) for i in xrange(oozie.endpoints.MAX_BACKOFF)]
+        for (delay, wanted) in zip(delays, expected):
+            self.assertAlmostEqual(delay, wanted, delta=1.0)
+
+    def testNeverAnsweredAfterMeasured(self):
+        self.pool.succeeded('good', 0.05)
+        self.pool.failed('dead')
+        self.pool._states['dead'].downUntil = 0.0
+        self.assertTrue(self.pool.suspect('dead'))
+        self.assertEqual(self.pool.ordered(['dead', 'good']), ['good', 'dead'])
+
+    def testSuccessRevives(self):
+        self.pool.failed('a')
+        self.assertFalse(self.pool.snapshot()['a']['live'])
+        self.pool.succeeded('a')
+        self.assertTrue(self.pool.snapshot()['a']['live'])
+        self.assertEqual(self.pool.snapshot()['a']['failures'], 0)
+
+
+
+class failoverTest(unittest.TestCase):
+    def setUp(self):
+        oozie.endpoints.pool.reset()
+        self.server = fakeservers.oozieServer().start()
+        self.jobId = self.server.addJob(status='RUNNING')
+        # Accepts connections but never answers.
+        self.silent = socket.socket()
+        self.silent.bind(('127.0.0.1', 0))
+        self.silent.listen(5)
+        self.silentUrl = 'http://127.0.0.1:' + str(self.silent.getsockname()[1]) + '/oozie'
+        # Refuses connections.
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        self.closedUrl = 'http://127.0.0.1:' + str(closed.getsockname()[1]) + '/oozie'
+        closed.close()
+
+    def tearDown(self):
+        self.silent.close()
+        self.server.stop()
+        oozie.endpoints.pool.reset()
+
+    def testReadTimesOutAndFailsOver(self):
+        client = oozie.oozie.client([self.silentUrl, self.server.url], timeout=0.2)
+        self.assertEqual(client.status(self.jobId), 'RUNNING')
+        self.assertFalse(oozie.endpoints.pool.snapshot()[self.silentUrl]['live'])
+
+    def testSubmitFailsOverWhenRefused(self):
+        client = oozie.oozie.client([self.closedUrl, self.server.url], timeout=0.2)
+        self.assertTrue(client.submit('<configuration/>') in self.server.jobs)
+
+    def testExpiredBackoffIsProbed(self):
+        # The silent server was the fastest until it stopped answering; once
+        # its back-off expires it is first in line again, but must pass a
+        # healthcheck before it gets the submission.
+        oozie.endpoints.pool.succeeded(self.silentUrl, 0.01)
+        oozie.endpoints.pool.succeeded(self.server.url.rstrip('/'), 0.05)
+        oozie.endpoints.pool.failed(self.silentUrl)
+        oozie.endpoints.pool._states[self.silentUrl].downUntil = 0.0
+        client = oozie.oozie.client([self.silentUrl, self.server.url], timeout=0.2)
+        self.assertTrue(client.submit('<configuration/>') in self.server.jobs)
+        self.assertFalse(oozie.endpoints.pool.snapshot()[self.silentUrl]['live'])
+
+    def testExpiredBackoffRecovers(self):
+        url = self.server.url.rstrip('/')
+        oozie.endpoints.pool.failed(url)
+        oozie.endpoints.pool._states[url].downUntil = 0.0
+        client = oozie.oozie.client([url], timeout=0.2)
+        self.assertEqual(client.status(self.jobId), 'RUNNING')
+        self.assertFalse(oozie.endpoints.pool.suspect(url))
+
+    def testSubmitDoesNotFailOverOnTimeout(self):
+        client = oozie.oozie.client([self.silentUrl, self.server.url], timeout=0.2)
+        self.assertRaises(requests.exceptions.Timeout, client.submit, '<configuration/>')
+        self.assertEqual(len(self.server.jobs), 1)
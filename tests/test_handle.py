@@ -0,0 +1,72 @@
+import os
+import pickle
+import unittest
+
+import oozie
+import oozie.endpoints
+
+from benchmarks import fakeservers
+
+
+
+class jobHandleTest(unittest.TestCase):
+    def setUp(self):
+        oozie.endpoints.pool.reset()
+        self.server = fakeservers.oozieServer().start()
+        self.environ = dict(os.environ)
+        os.environ['OOZIE_URL'] = self.server.url
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        self.server.stop()
+        oozie.endpoints.pool.reset()
+
+    def testPickleRoundTrip(self):
+        handle = oozie.jobHandle('0000001-000000000000000-oozie-oozi-W', appPath='hdfs:///tmp/app', outputPath='hdfs:///tmp/output', lastStatus='RUNNING', oozieUrl='http://oozie:11000/oozie')
+        for protocol in [0, 1, 2]:
+            copy = pickle.loads(pickle.dumps(handle, protocol))
+            for name in ['id', 'appPath', 'outputPath', 'lastStatus', 'oozieUrl']:
+                self.assertEqual(getattr(copy, name), getattr(handle, name))
+            self.assertEqual(copy, handle)
+            self.assertEqual(hash(copy), hash(handle))
+
+    def testSlots(self):
+        handle = oozie.jobHandle('job')
+        self.assertFalse(hasattr(handle, '__dict__'))
+        def assign():
+            handle.extra = 1
+        self.assertRaises(AttributeError, assign)
+
+    def testRefreshJobHandle(self):
+        jobId = self.server.addJob(status='RUNNING')
+        handle = oozie.jobHandle(jobId, lastStatus='PREP', oozieUrl=self.server.url)
+        self.assertEqual(oozie.refreshJobHandle(handle).lastStatus, 'RUNNING')
+        self.assertFalse(handle.finished)
+        self.server.jobs[jobId]['status'] = 'SUCCEEDED'
+        self.assertTrue(oozie.refreshJobHandle(handle) is handle)
+        self.assertTrue(handle.finished)
+
+    def testHandleFromEnvironment(self):
+        # A handle with no URL uses OOZIE_URL in whichever process uses it.
+        jobId = self.server.addJob(status='KILLED')
+        self.assertEqual(oozie.jobHandle(jobId).status, 'KILLED')
+
+    def testConfigurationHandle(self):
+        wf = oozie.workflowJob({'name': 'handleTest', 'actions': []})
+        wf._id = self.server.addJob()
+        wf._sourcePath = '/tmp/oozieworkflows/handleTest'
+        wf._outputPath = 'hdfs://namenode:8020/tmp/oozieoutput/handleTest'
+        handle = wf.handle
+        self.assertEqual(handle.id, wf._id)
+        self.assertEqual(handle.appPath, 'hdfs:///tmp/oozieworkflows/handleTest')
+        self.assertEqual(handle.outputPath, 'hdfs://namenode:8020/tmp/oozieoutput/handleTest')
+        self.assertEqual(handle.oozieUrl, self.server.url.rstrip('/'))
+
+    def testReconnectedHandle(self):
+        # A job reconnected to by id never had its paths assigned.
+        jobId = self.server.addJob(status='RUNNING')
+        handle = oozie.workflowJob(jobId).handle
+        self.assertEqual(handle.id, jobId)
+        self.assertEqual(handle.appPath, None)
+        self.assertEqual(handle.outputPath, None)
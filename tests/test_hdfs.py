@@ -0,0 +1,92 @@
+import bz2
+import gzip
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import oozie
+import oozie.errors
+import oozie.hdfs
+
+from benchmarks import fakeservers
+
+
+
+class compressedWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeservers.webHdfsServer().start()
+        self.client = oozie.hdfs.client(self.server.url)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def testGzip(self):
+        data = 'a log line\n' * 1000
+        self.assertEqual(self.client.write('/tmp/logs', data, compression='gzip'), 201)
+        stored = self.server.files['/tmp/logs.gz']
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO.StringIO(stored)).read(), data)
+
+    def testBzip2FromFile(self):
+        data = 'a log line\n' * 1000
+        self.assertEqual(self.client.write('/tmp/logs', StringIO.StringIO(data), compression='bzip2'), 201)
+        self.assertEqual(bz2.decompress(self.server.files['/tmp/logs.bz2']), data)
+
+    def testUnicodeIsEncoded(self):
+        data = u'caf\xe9 \u2603\n'
+        self.client.write('/tmp/text', data, compression='gzip')
+        stored = self.server.files['/tmp/text.gz']
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO.StringIO(stored)).read(), data.encode('utf-8'))
+
+    def testUnsupportedCompression(self):
+        self.assertRaises(oozie.errors.ClientError, self.client.write, '/tmp/x', 'data', compression='lzma')
+
+    def testAlreadyCompressedIsUnchanged(self):
+        compressed = StringIO.StringIO()
+        with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+            f.write('a log line\n' * 1000)
+        self.client.write('/tmp/logs.gz', compressed.getvalue(), compression='gzip')
+        self.assertEqual(self.server.files['/tmp/logs.gz'], compressed.getvalue())
+        self.client.write('/tmp/other.gz', compressed.getvalue(), compression='bzip2')
+        self.assertEqual(self.server.files['/tmp/other.gz'], compressed.getvalue())
+        self.assertFalse('/tmp/other.gz.bz2' in self.server.files)
+
+    def testNameNodeErrorIsReported(self):
+        self.server.failureRate = 1.0
+        try:
+            self.client.write('/tmp/x', 'data', compression='gzip')
+        except oozie.errors.ServerError as e:
+            self.assertIn('500', str(e))
+            self.assertIn('injected failure', str(e))
+        else:
+            self.fail('name node failure not reported')
+
+
+
+class compressedUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeservers.webHdfsServer().start()
+        self.environ = dict(os.environ)
+        os.environ['WEBHDFS_URL'] = self.server.url
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.directory)
+        self.server.stop()
+
+    def testMixedDirectory(self):
+        # Logs which are already compressed are uploaded as they are.
+        compressed = bz2.compress('old line\n' * 100)
+        with open(os.path.join(self.directory, 'new.log'), 'wb') as f:
+            f.write('new line\n' * 100)
+        with open(os.path.join(self.directory, 'old.log.bz2'), 'wb') as f:
+            f.write(compressed)
+        wf = oozie.workflowJob({'name': 'uploadTest', 'actions': []})
+        wf.upload(self.directory, '/tmp/upload', compression='gzip')
+        self.assertEqual(self.server.files['/tmp/upload/old.log.bz2'], compressed)
+        self.assertFalse('/tmp/upload/old.log.bz2.gz' in self.server.files)
+        stored = self.server.files['/tmp/upload/new.log.gz']
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO.StringIO(stored)).read(), 'new line\n' * 100)
@@ -0,0 +1,53 @@
+import unittest
+
+import oozie.hdfs
+import oozie.instrumentation
+
+from benchmarks import fakeservers
+
+
+
+class histogramTest(unittest.TestCase):
+    def testSummary(self):
+        h = oozie.instrumentation.histogram()
+        for value in [0.001, 0.002, 0.02, 0.2, 2.0]:
+            h.observe(value)
+        self.assertEqual(h.count, 5)
+        self.assertEqual(h.min, 0.001)
+        self.assertEqual(h.max, 2.0)
+        self.assertAlmostEqual(h.mean, 2.223 / 5)
+        self.assertEqual(h.percentile(50), 0.025)
+        self.assertEqual(h.percentile(100), 2.0)
+
+class hookTest(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        oozie.instrumentation.addHook(self.events.append)
+        self.server = fakeservers.webHdfsServer().start()
+
+    def tearDown(self):
+        oozie.instrumentation.removeHook(self.events.append)
+        self.server.stop()
+
+    def testWebHdfsCallsReportStatusAndBytes(self):
+        client = oozie.hdfs.client(self.server.url)
+        client.mkdir('/tmp/a')
+        client.listdir('/tmp')
+        client.rmdir('/tmp/a')
+        byOperation = dict([(e['operation'], e) for e in self.events])
+        self.assertEqual(sorted(byOperation), ['listdir', 'mkdir', 'probe', 'rmdir'])
+        for event in self.events:
+            self.assertEqual(event['service'], 'webhdfs')
+            self.assertEqual(event['status'], 200)
+            self.assertTrue(event['bytesIn'] > 0)
+            self.assertTrue(event['latency'] >= 0)
+
+    def testBrokenHookDoesNotBreakCalls(self):
+        def broken(event):
+            raise RuntimeError('exporter down')
+        oozie.instrumentation.addHook(broken)
+        try:
+            oozie.hdfs.client(self.server.url).mkdir('/tmp/b')
+        finally:
+            oozie.instrumentation.removeHook(broken)
+        self.assertIn('/tmp/b', self.server.directories)
@@ -0,0 +1,146 @@
+import unittest
+
+import oozie.endpoints
+import oozie.instrumentation
+import oozie.oozie
+
+from benchmarks import fakeservers
+
+
+
+class logStreamTest(unittest.TestCase):
+    def setUp(self):
+        oozie.endpoints.pool.reset()
+        self.server = fakeservers.oozieServer().start()
+        self.client = oozie.oozie.client(self.server.url)
+        self.jobId = self.server.addJob(status='RUNNING')
+        self.events = []
+        oozie.instrumentation.addHook(self.events.append)
+
+    def tearDown(self):
+        oozie.instrumentation.removeHook(self.events.append)
+        self.server.stop()
+        oozie.endpoints.pool.reset()
+
+    def _events(self, operation):
+        return [e for e in self.events if e['operation'] == operation]
+
+    def _poll(self, stream):
+        del self.events[:]
+        return stream.poll()
+
+    def testRangeHonored(self):
+        self.server.rangeRequests = True
+        self.server.logs[self.jobId] = 'first\nsecond\n'
+        stream = self.client.log(self.jobId)
+        self.assertEqual(self._poll(stream), ['first', 'second'])
+        self.server.logs[self.jobId] += 'third\n'
+        self.assertEqual(self._poll(stream), ['third'])
+        self.assertEqual(stream.offset, 19)
+        self.assertEqual([e['status'] for e in self._events('log')], [206])
+        self.assertEqual([e['bytesIn'] for e in self._events('log.read')], [6])
+
+    def testRangeIgnored(self):
+        self.server.logs[self.jobId] = 'first\nsecond\n'
+        stream = self.client.log(self.jobId)
+        self.assertEqual(self._poll(stream), ['first', 'second'])
+        self.server.logs[self.jobId] += 'third\n'
+        self.assertEqual(self._poll(stream), ['third'])
+        self.assertEqual(stream.offset, 19)
+        self.assertEqual([e['status'] for e in self._events('log')], [200])
+        self.assertEqual([e['bytesIn'] for e in self._events('log.read')], [19])
+
+    def testNothingNew(self):
+        self.server.rangeRequests = True
+        self.server.logs[self.jobId] = 'first\n'
+        stream = self.client.log(self.jobId, offset=6)
+        self.assertEqual(self._poll(stream), [])
+        self.assertEqual(stream.offset, 6)
+        self.assertEqual([e['status'] for e in self._events('log')], [416])
+        self.assertEqual(self._events('log.read'), [])
+
+    def testUnterminatedLastLine(self):
+        self.server.logs[self.jobId] = 'first\nsec'
+        stream = self.client.log(self.jobId)
+        # A poll leaves the incomplete line for next time...
+        self.assertEqual(stream.poll(), ['first'])
+        self.assertEqual(stream.offset, 6)
+        self.server.logs[self.jobId] += 'ond\nthi'
+        self.assertEqual(stream.poll(), ['second'])
+        # ...but the final fetch of a stream yields it as it is.
+        self.assertEqual(list(stream), ['thi'])
+        self.assertEqual(stream.offset, 16)
+
+    def testFollowUntilFinished(self):
+        self.server.logs[self.jobId] = 'first\n'
+        stream = self.client.log(self.jobId, follow=True, interval=0)
+        lines = iter(stream)
+        self.assertEqual(lines.next(), 'first')
+        self.server.logs[self.jobId] += 'last'
+        self.server.jobs[self.jobId]['status'] = 'SUCCEEDED'
+        self.assertEqual(list(lines), ['last'])
+
+    def _timestamped(self):
+        self.server.logs[self.jobId] = (
+            '2013-03-19 22:16:04,100  INFO started\n'
+            '2013-03-19 22:16:05,200  INFO running\n'
+            '2013-03-19 22:16:05,200  WARN retrying\n'
+            '\tat a stack frame\n'
+        )
+        return self.client.log(self.jobId)
+
+    def _grow(self):
+        self.server.logs[self.jobId] += (
+            '\tat another frame\n'
+            '2013-03-19 22:16:05,200  INFO same time\n'
+            '2013-03-19 22:16:06,300  INFO done\n'
+        )
+
+    def testLogFilterStart(self):
+        # Range is ignored, as by Oozie itself, but logfilter is honored.
+        self.server.logFilters = True
+        stream = self._timestamped()
+        self.assertEqual(len(self._poll(stream)), 4)
+        # The first poll past the start learns that Range is ignored.
+        self._grow()
+        self.assertEqual(self._poll(stream), ['\tat another frame', '2013-03-19 22:16:05,200  INFO same time', '2013-03-19 22:16:06,300  INFO done'])
+        fullLength = len(self.server.logs[self.jobId])
+        self.assertEqual(stream.offset, fullLength)
+        # Later polls fetch only from the last timestamp seen.
+        self.server.logs[self.jobId] += '2013-03-19 22:16:07,000  INFO more\n'
+        self.assertEqual(self._poll(stream), ['2013-03-19 22:16:07,000  INFO more'])
+        self.assertEqual([e['bytesIn'] for e in self._events('log.read')], [len('2013-03-19 22:16:06,300  INFO done\n2013-03-19 22:16:07,000  INFO more\n')])
+        self.assertEqual(stream.offset, len(self.server.logs[self.jobId]))
+        self.assertEqual(self._poll(stream), [])
+
+    def testLogFilterDropsBoundary(self):
+        # Several lines share the last timestamp seen; only new ones are
+        # yielded.
+        self.server.logFilters = True
+        stream = self._timestamped()
+        self._poll(stream)
+        self.server.logs[self.jobId] += '2013-03-19 22:16:05,200  INFO later\n'
+        self.assertEqual(self._poll(stream), ['2013-03-19 22:16:05,200  INFO later'])
+        self._grow()
+        self.assertEqual(self._poll(stream), ['\tat another frame', '2013-03-19 22:16:05,200  INFO same time', '2013-03-19 22:16:06,300  INFO done'])
+        self.assertTrue(self._events('log.read')[0]['bytesIn'] < len(self.server.logs[self.jobId]))
+
+    def testLogFilterIgnored(self):
+        # Older Oozie ignores both Range and logfilter; we fall back to
+        # skipping what we have seen.
+        stream = self._timestamped()
+        self._poll(stream)
+        self._grow()
+        self.assertEqual(len(self._poll(stream)), 3)
+        self.server.logs[self.jobId] += '2013-03-19 22:16:07,000  INFO more\n'
+        self.assertEqual(self._poll(stream), ['2013-03-19 22:16:07,000  INFO more'])
+        self.server.logs[self.jobId] += '2013-03-19 22:16:08,000  INFO last\n'
+        self.assertEqual(self._poll(stream), ['2013-03-19 22:16:08,000  INFO last'])
+        self.assertEqual(stream.offset, len(self.server.logs[self.jobId]))
+
+    def testAbandonedStream(self):
+        self.server.logs[self.jobId] = 'line\n' * 100000
+        lines = iter(self.client.log(self.jobId))
+        self.assertEqual(lines.next(), 'line')
+        lines.close()
+        self.assertEqual(self.client.status(self.jobId), 'RUNNING')
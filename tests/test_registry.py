@@ -0,0 +1,123 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import oozie
+import oozie.endpoints
+import oozie.registry
+
+from benchmarks import fakeservers
+
+
+
+WORKFLOW = {
+    'name': 'registryTest',
+    'actions': [{
+        'template': 'map-reduce',
+        'mapper': '/bin/cat',
+        'reducer': '/bin/cat',
+        'input': '${input}',
+    }],
+}
+
+class registryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.oozieServer = fakeservers.oozieServer().start()
+        self.webhdfsServer = fakeservers.webHdfsServer().start()
+        self.environ = dict(os.environ)
+        os.environ['OOZIE_URL'] = self.oozieServer.url
+        os.environ['WEBHDFS_URL'] = self.webhdfsServer.url
+        oozie.endpoints.pool.reset()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        oozie.registry._registries.clear()
+        oozie.registry._failures.clear()
+        oozie.endpoints.pool.reset()
+        self.oozieServer.stop()
+        self.webhdfsServer.stop()
+        shutil.rmtree(self.directory)
+
+    def _submit(self):
+        wf = oozie.workflowJob(WORKFLOW)
+        wf.fix()
+        self.assertTrue(wf.submit({'input': 'hdfs:///tmp/input'}))
+        return wf
+
+    def testSubmitIsRecorded(self):
+        path = os.path.join(self.directory, 'jobs.db')
+        os.environ['OOZIE_JOB_REGISTRY'] = path
+        wf = self._submit()
+        self.assertEqual(oozie.registry.shared(path).get(wf.id).lastStatus, 'PREP')
+
+    def testUnopenableRegistryDoesNotBreakSubmit(self):
+        # A directory cannot be opened as a database.
+        os.environ['OOZIE_JOB_REGISTRY'] = self.directory
+        wf = self._submit()
+        self.assertTrue(wf.id in self.oozieServer.jobs)
+        self.assertEqual(wf.status, 'PREP')
+
+    def testUnopenableRegistryIsTriedOnce(self):
+        warnings = []
+        handler = logging.Handler()
+        handler.emit = lambda record: warnings.append(record.getMessage())
+        logging.getLogger().addHandler(handler)
+        try:
+            self.assertEqual(oozie.registry.optional(self.directory), None)
+            self.assertEqual(oozie.registry.optional(self.directory), None)
+            self.assertRaises(oozie.errors.ClientError, oozie.registry.shared, self.directory)
+        finally:
+            logging.getLogger().removeHandler(handler)
+        self.assertEqual(len([w for w in warnings if 'job registry' in w]), 1)
+        self.assertEqual(oozie.registry._registries, {})
+
+    def testBrokenRegistryDoesNotBreakSubmit(self):
+        path = os.path.join(self.directory, 'jobs.db')
+        os.environ['OOZIE_JOB_REGISTRY'] = path
+        oozie.registry.shared(path)._execute('DROP TABLE jobs')
+        wf = self._submit()
+        self.assertTrue(wf.id in self.oozieServer.jobs)
+        self.assertEqual(wf.status, 'PREP')
+
+    def testRefreshHandlesEachJob(self):
+        jobs = oozie.registry.jobRegistry(os.path.join(self.directory, 'jobs.db'))
+        running = self.oozieServer.addJob(status='RUNNING')
+        succeeded = self.oozieServer.addJob(status='RUNNING')
+        purged = self.oozieServer.addJob(status='RUNNING')
+        for jobId in [purged, running, succeeded]:
+            jobs.record(oozie.jobHandle(jobId, lastStatus='RUNNING', oozieUrl=self.oozieServer.url))
+        unreachable = '0000000-000000000000000-oozie-oozi-W'
+        jobs.record(oozie.jobHandle(unreachable, lastStatus='RUNNING', oozieUrl='http://127.0.0.1:1/oozie/'))
+        self.oozieServer.jobs[succeeded]['status'] = 'SUCCEEDED'
+        del self.oozieServer.jobs[purged]
+        self.assertEqual([h.id for h in jobs.refresh()], [running, unreachable])
+        self.assertEqual(jobs.get(purged).lastStatus, oozie.registry.UNKNOWN_STATUS)
+        self.assertEqual(jobs.get(succeeded).lastStatus, 'SUCCEEDED')
+        self.assertEqual(sorted([h.id for h in jobs.active()]), sorted([running, unreachable]))
+
+    def testRefreshKeepsJobsThroughServerErrors(self):
+        jobs = oozie.registry.jobRegistry(os.path.join(self.directory, 'jobs.db'))
+        jobId = self.oozieServer.addJob(status='RUNNING')
+        jobs.record(oozie.jobHandle(jobId, lastStatus='RUNNING', oozieUrl=self.oozieServer.url))
+        self.oozieServer.failureRate = 1.0
+        self.assertEqual([h.id for h in jobs.refresh()], [jobId])
+        self.assertEqual(jobs.get(jobId).lastStatus, 'RUNNING')
+
+    def testRefreshKeepsJobsWhenRefused(self):
+        # Expired credentials must not write off every job in flight.
+        jobs = oozie.registry.jobRegistry(os.path.join(self.directory, 'jobs.db'))
+        jobId = self.oozieServer.addJob(status='RUNNING')
+        jobs.record(oozie.jobHandle(jobId, lastStatus='RUNNING', oozieUrl=self.oozieServer.url))
+        self.oozieServer.failureRate = 1.0
+        self.oozieServer.failureStatus = 401
+        self.assertEqual([h.id for h in jobs.refresh()], [jobId])
+        self.assertEqual([h.id for h in jobs.active()], [jobId])
+        self.assertEqual(jobs.get(jobId).lastStatus, 'RUNNING')
+
+    def testUnencodableParameters(self):
+        jobs = oozie.registry.jobRegistry(os.path.join(self.directory, 'jobs.db'))
+        self.assertRaises(oozie.errors.ClientError, jobs.record, oozie.jobHandle('job'), {'when': object()})
@@ -0,0 +1,199 @@
+import email.utils
+import unittest
+
+import oozie.endpoints
+import oozie.oozie
+import oozie.timeline
+
+from benchmarks import fakeservers
+
+
+
+START = 1363731364
+
+def _time(offset):
+    return email.utils.formatdate(START + offset, usegmt=True)
+
+def _action(name, transition, start, end, status='OK', **fields):
+    action = {
+        'name': name,
+        'type': 'map-reduce',
+        'status': status,
+        'transition': transition,
+        'startTime': _time(start),
+        'endTime': _time(end),
+        'externalId': 'job_' + name,
+        'retries': 0,
+    }
+    action.update(fields)
+    return action
+
+def _job(actions, end):
+    return {
+        'id': '0000001-000000000000000-oozie-oozi-W',
+        'appName': 'timelineTest',
+        'status': 'SUCCEEDED',
+        'startTime': _time(0),
+        'endTime': _time(end),
+        'actions': actions,
+    }
+
+def _byName(profile):
+    return dict([(a['name'], a) for a in profile['actions']])
+
+LINEAR = _job([
+    _action('a', 'b', 1, 10),
+    _action('b', 'c', 12, 20),
+    _action('c', 'end', 25, 30),
+], 31)
+
+# a forks into x and y, which join before d.  x finishes before y starts,
+# though y only waited for a.
+FORK_JOIN = _job([
+    _action('a', 'fork', 0, 10),
+    _action('x', 'join', 11, 13),
+    _action('y', 'join', 15, 40),
+    _action('d', 'end', 41, 50),
+], 51)
+
+FORK_JOIN_DEFINITION = '''<workflow-app name="timelineTest" xmlns="uri:oozie:workflow:0.2">
+    <start to="a"/>
+    <action name="a"><map-reduce/><ok to="fork"/><error to="kill"/></action>
+    <fork name="fork"><path start="x"/><path start="y"/></fork>
+    <action name="x"><map-reduce/><ok to="join"/><error to="kill"/></action>
+    <action name="y"><map-reduce/><ok to="join"/><error to="kill"/></action>
+    <join name="join" to="d"/>
+    <action name="d"><map-reduce/><ok to="end"/><error to="kill"/></action>
+    <kill name="kill"><message>failed</message></kill>
+    <end name="end"/>
+</workflow-app>'''
+
+class buildProfileTest(unittest.TestCase):
+    def testLinear(self):
+        profile = oozie.timeline.buildProfile(LINEAR)
+        actions = _byName(profile)
+        self.assertEqual(profile['criticalPath'], ['a', 'b', 'c'])
+        self.assertEqual(profile['duration'], 31.0)
+        self.assertEqual(actions['a']['queueWait'], 1.0)
+        self.assertEqual(actions['b']['predecessor'], 'a')
+        self.assertEqual(actions['c']['queueWait'], 5.0)
+        self.assertEqual(actions['c']['runTime'], 5.0)
+        self.assertEqual(profile['slowest'], 'a')
+
+    def testForkJoinWithDefinition(self):
+        profile = oozie.timeline.buildProfile(FORK_JOIN, FORK_JOIN_DEFINITION)
+        actions = _byName(profile)
+        self.assertEqual(actions['x']['predecessor'], 'a')
+        self.assertEqual(actions['y']['predecessor'], 'a')
+        self.assertEqual(actions['y']['queueWait'], 5.0)
+        self.assertEqual(actions['d']['predecessor'], 'y')
+        self.assertEqual(profile['criticalPath'], ['a', 'y', 'd'])
+        self.assertFalse(actions['x']['critical'])
+
+    def testForkJoinWithoutDefinition(self):
+        # The fallback only considers actions which left through a control
+        # node, so d still follows y; y is wrongly attributed to x.
+        actions = _byName(oozie.timeline.buildProfile(FORK_JOIN))
+        self.assertEqual(actions['x']['predecessor'], 'a')
+        self.assertEqual(actions['d']['predecessor'], 'y')
+
+    def testFallbackIgnoresActionTransitions(self):
+        # c transitioned from nothing we know of; b went straight to another
+        # action, so it cannot be what c waited for.
+        job = _job([
+            _action('a', 'b', 0, 5),
+            _action('b', 'd', 6, 8),
+            _action('c', 'end', 9, 12),
+            _action('d', 'end', 13, 14),
+        ], 15)
+        actions = _byName(oozie.timeline.buildProfile(job))
+        self.assertEqual(actions['c']['predecessor'], None)
+        self.assertEqual(actions['c']['queueWait'], 9.0)
+
+    def testErrorTransitionNotTaken(self):
+        # recover is only reached on a's error path, which a did not take.
+        definition = '''<workflow-app name="t" xmlns="uri:oozie:workflow:0.2">
+            <start to="a"/>
+            <action name="a"><map-reduce/><ok to="b"/><error to="recover"/></action>
+            <action name="recover"><map-reduce/><ok to="b"/><error to="kill"/></action>
+            <action name="b"><map-reduce/><ok to="end"/><error to="kill"/></action>
+            <kill name="kill"><message>failed</message></kill>
+            <end name="end"/>
+        </workflow-app>'''
+        job = _job([
+            _action('a', 'b', 0, 5),
+            _action('b', 'end', 6, 8),
+        ], 9)
+        actions = _byName(oozie.timeline.buildProfile(job, definition))
+        self.assertEqual(actions['b']['predecessor'], 'a')
+
+    def testUnfinishedJob(self):
+        job = _job([_action('a', None, 0, 5), {'name': 'b', 'status': 'RUNNING', 'startTime': _time(6)}], 0)
+        job['endTime'] = None
+        profile = oozie.timeline.buildProfile(job)
+        self.assertEqual(profile['duration'], None)
+        self.assertEqual(profile['criticalPath'], ['a'])
+
+
+
+class aggregateProfilesTest(unittest.TestCase):
+    def testSummarizesEachAction(self):
+        slow = _job([
+            _action('a', 'fork', 0, 10),
+            _action('x', 'join', 11, 60),
+            _action('y', 'join', 15, 40, status='ERROR', retries=2),
+            _action('d', 'end', 61, 70),
+        ], 71)
+        profiles = [
+            oozie.timeline.buildProfile(FORK_JOIN, FORK_JOIN_DEFINITION),
+            oozie.timeline.buildProfile(slow, FORK_JOIN_DEFINITION),
+            oozie.timeline.buildProfile(FORK_JOIN, FORK_JOIN_DEFINITION),
+        ]
+        summary = oozie.timeline.aggregateProfiles(profiles)
+        self.assertEqual(summary['runs'], 3)
+        self.assertEqual(summary['appNames'], ['timelineTest'])
+        self.assertEqual(summary['duration']['median'], 51.0)
+        self.assertEqual(summary['duration']['max'], 71.0)
+        self.assertEqual(summary['actions']['x']['critical'], 1)
+        self.assertEqual(summary['actions']['y']['critical'], 2)
+        self.assertEqual(summary['actions']['y']['failures'], 1)
+        self.assertEqual(summary['actions']['y']['retries'], 2)
+        self.assertEqual(summary['actions']['x']['runTime']['max'], 49.0)
+
+    def testNoRuns(self):
+        summary = oozie.timeline.aggregateProfiles([])
+        self.assertEqual(summary['runs'], 0)
+        self.assertEqual(summary['duration']['median'], None)
+
+
+
+class clientProfileTest(unittest.TestCase):
+    def setUp(self):
+        oozie.endpoints.pool.reset()
+        self.server = fakeservers.oozieServer().start()
+        self.client = oozie.oozie.client(self.server.url)
+
+    def tearDown(self):
+        self.server.stop()
+        oozie.endpoints.pool.reset()
+
+    def _addJob(self, **fields):
+        job = dict(FORK_JOIN)
+        del job['id']
+        job.update(fields)
+        return self.server.addJob(**job)
+
+    def testUsesDefinition(self):
+        jobId = self._addJob(definition=FORK_JOIN_DEFINITION)
+        self.assertEqual(_byName(self.client.profile(jobId))['y']['predecessor'], 'a')
+
+    def testWithoutDefinition(self):
+        jobId = self._addJob()
+        self.assertEqual(_byName(self.client.profile(jobId))['y']['predecessor'], 'x')
+
+    def testProfileRuns(self):
+        for i in xrange(3):
+            self._addJob(definition=FORK_JOIN_DEFINITION)
+        summary = self.client.profileRuns('timelineTest')
+        self.assertEqual(summary['runs'], 3)
+        self.assertEqual(summary['actions']['y']['critical'], 3)